@@ -1,5 +1,11 @@
+import io
 import os
+import re
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import List
 
 import azure.cognitiveservices.speech as speechsdk
 from celery import Celery
@@ -21,6 +27,18 @@ cos_client = CosS3Client(cos_config)
 
 cos_local = Path("/cos")
 
+# 长文本按句切分后并发合成: 单个片段的最大字符数、同时合成的片段数、单个片段失败后的重试次数
+tts_chunk_max_len = int(os.environ.get("TTS_CHUNK_MAX_LEN", "120"))
+tts_chunk_parallelism = int(os.environ.get("TTS_CHUNK_PARALLELISM", "4"))
+tts_chunk_retries = int(os.environ.get("TTS_CHUNK_RETRIES", "2"))
+# 合成结果是否上传 COS; 后续任务(RVC)与本服务共享 /cos 目录时可关闭, 直接读取本地文件
+# 关闭时 mercury 也要设置相同的 AZURE_UPLOAD_OUTPUT, 不为中间音频创建 File 记录, 见 README
+azure_upload_output = os.environ.get("AZURE_UPLOAD_OUTPUT", "true").lower() != "false"
+
+# 与 src/utils/text.py 相同的切分规则, 本文件单独部署, 所以复制一份
+_sentence_end = re.compile(r"(?<=[。！？!?；;…\n])|(?<=\.)(?=\s)")
+_clause_end = re.compile(r"(?<=[，,、：:])")
+
 
 def get_local_path(key: str) -> Path:
     path = cos_local / key
@@ -32,24 +50,79 @@ def upload_cos_file(key: str):
     cos_client.upload_file(Bucket=cos_bucket, Key=key, LocalFilePath=get_local_path(key))
 
 
-@celery_app.task(name="azure_infer", queue="azure_infer")
-def azure_infer_task(text: str, audio_profile: str, output_cos: str) -> str:
-    """
-    微软 TTS 服务
-    :param text: 音频文字内容
-    :param audio_profile: 配置
-    :param output_cos: 合成的音频文件 COS key
-    :return: output_cos
-    """
-
-    dest = get_local_path(output_cos)
-
+def _hard_split(text: str, max_len: int) -> List[str]:
+    pieces = []
+    text = text.strip()
+    while len(text) > max_len:
+        cut = max_len
+        # 会切断英文单词时退到前一个空白处
+        if text[cut - 1].isascii() and text[cut - 1].isalnum() and text[cut].isascii() and text[cut].isalnum():
+            space = text.rfind(" ", 0, max_len)
+            if space > 0:
+                cut = space
+        pieces.append(text[:cut].strip())
+        text = text[cut:].strip()
+    if text:
+        pieces.append(text)
+    return pieces
+
+
+def split_sentences(text: str, max_len: int) -> List[str]:
+    pieces = []
+    for sentence in _sentence_end.split(text):
+        sentence = sentence.strip()
+        if len(sentence) <= max_len:
+            pieces.append(sentence)
+            continue
+        current = ""
+        for clause in _clause_end.split(sentence):
+            if len(current) + len(clause) > max_len:
+                pieces.append(current.strip())
+                *head, current = _hard_split(clause, max_len) or [""]
+                pieces.extend(head)
+                continue
+            current += clause
+        pieces.append(current.strip())
+
+    chunks = []
+    current = ""
+    for piece in filter(None, pieces):
+        separator = " " if current and piece[0].isascii() and current[-1].isascii() else ""
+        if current and len(current) + len(separator) + len(piece) > max_len:
+            chunks.append(current)
+            current = piece
+        else:
+            current = f"{current}{separator}{piece}"
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def concat_wavs(audios: List[bytes], dest: Path):
+    """直接拷贝内存中各段 WAV 的 PCM 采样数据拼接, 不重新编码"""
+    params = None
+    with wave.open(str(dest), "wb") as writer:
+        for audio in audios:
+            with wave.open(io.BytesIO(audio), "rb") as reader:
+                current = (reader.getnchannels(), reader.getsampwidth(), reader.getframerate())
+                if params is None:
+                    params = current
+                    writer.setnchannels(current[0])
+                    writer.setsampwidth(current[1])
+                    writer.setframerate(current[2])
+                elif current != params:
+                    raise Exception(f"wav format mismatch: {current} != {params}")
+                writer.writeframes(reader.readframes(reader.getnframes()))
+
+
+def synthesize(text: str, audio_profile: str) -> bytes:
+    """合成音频, 返回内存中的 WAV 数据"""
     speech_config = speechsdk.SpeechConfig(subscription=azure_speech_key, region=azure_speech_region)
     # remove all (xxx), example: "zh-CN-XiaoxiaoNeural (Female)" to be "zh-CN-XiaoxiaoNeural"
     speech_config.speech_synthesis_voice_name = audio_profile.split(" (")[0]
-    audio_config = speechsdk.audio.AudioOutputConfig(use_default_speaker=True, filename=str(dest))
 
-    speech_synthesizer = speechsdk.SpeechSynthesizer(speech_config=speech_config, audio_config=audio_config)
+    # audio_config=None: 音频数据在 result.audio_data 中, 不写中间文件
+    speech_synthesizer = speechsdk.SpeechSynthesizer(speech_config=speech_config, audio_config=None)
 
     speech_synthesis_result = speech_synthesizer.speak_text_async(text).get()
     if speech_synthesis_result.reason == speechsdk.ResultReason.Canceled:
@@ -59,8 +132,7 @@ def azure_infer_task(text: str, audio_profile: str, output_cos: str) -> str:
             raise Exception(f"error details: {cancellation_details.error_details}")
 
     if speech_synthesis_result.reason == speechsdk.ResultReason.SynthesizingAudioCompleted:
-        upload_cos_file(output_cos)
-        return output_cos
+        return speech_synthesis_result.audio_data
     elif speech_synthesis_result.reason == speechsdk.ResultReason.Canceled:
         cancellation_details = speech_synthesis_result.cancellation_details
         print("Speech synthesis canceled: {}".format(cancellation_details.reason))
@@ -68,3 +140,40 @@ def azure_infer_task(text: str, audio_profile: str, output_cos: str) -> str:
             raise Exception(cancellation_details.error_details)
     else:
         raise Exception(f"unknown reason: {speech_synthesis_result.reason}")
+
+
+def synthesize_with_retry(text: str, audio_profile: str) -> bytes:
+    for attempt in range(tts_chunk_retries + 1):
+        try:
+            return synthesize(text, audio_profile)
+        except Exception as e:
+            if attempt == tts_chunk_retries:
+                raise
+            print(f"synthesize chunk failed, attempt {attempt + 1}: {e}")
+            time.sleep(2**attempt)
+
+
+@celery_app.task(name="azure_infer", queue="azure_infer")
+def azure_infer_task(text: str, audio_profile: str, output_cos: str) -> str:
+    """
+    微软 TTS 服务, 长文本按句切分后并发合成再拼接
+    :param text: 音频文字内容
+    :param audio_profile: 配置
+    :param output_cos: 合成的音频文件 COS key
+    :return: output_cos
+    """
+
+    dest = get_local_path(output_cos)
+    chunks = split_sentences(text, tts_chunk_max_len)
+    # 各片段只保存在内存中, 最后只写一次输出文件
+    if len(chunks) <= 1:
+        dest.write_bytes(synthesize(text, audio_profile))
+    else:
+        with ThreadPoolExecutor(max_workers=tts_chunk_parallelism) as executor:
+            audios = list(executor.map(lambda chunk: synthesize_with_retry(chunk, audio_profile), chunks))
+        concat_wavs(audios, dest)
+
+    if azure_upload_output:
+        upload_cos_file(output_cos)
+    return output_cos
+
@@ -25,19 +25,22 @@ task_id=$(echo $res | jq '.task_id')
 echo $res \n
 
 echo $task_id
-file_id=0
-
 while true; do
     list=$(curl --fail -X GET -H "Authorization: Bearer $token" $host/tasks?task_id=$task_id)
-    # if list[0].status is 2, break
+    # 2 succeeded, 3 failed
     status=$(echo $list | jq '.[0].status')
-    file_id=$(echo $list | jq '.[0].res.output_video_file_id')
-    if [ $status -eq 2 ]; then
+    if [ $status -eq 2 ] || [ $status -eq 3 ]; then
         break
     fi
-    # wait 10 seconds
-    sleep 10
+    # block until the task finishes, the event stream is closed then
+    curl --fail -sN -H "Authorization: Bearer $token" $host/tasks/$task_id/events > /dev/null || sleep 10
 done
 
+file_id=$(echo $list | jq '.[0].res.output_video_file_id')
+if [ $status -ne 2 ]; then
+    echo "task $task_id failed: $list"
+    exit 1
+fi
+
 # download
 curl --fail -X GET -H "Authorization: Bearer $token" $host/file/download?file_id=$file_id --output ${model_name}_$(date +%s).mp4
\ No newline at end of file
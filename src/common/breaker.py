@@ -0,0 +1,58 @@
+import time
+from typing import Callable
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    Closed: all calls pass. After `failure_threshold` consecutive failures it
+    opens and rejects calls for `cooldown` seconds, then lets a single trial
+    call through (half-open): success closes it again, failure re-opens it
+    for another cooldown.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, cooldown: float = 30, clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return self.CLOSED
+        if self._trial or self.clock() - self.opened_at >= self.cooldown:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def available(self) -> bool:
+        """Whether a call may be sent now, doesn't change the state."""
+        state = self.state
+        return state == self.CLOSED or (state == self.HALF_OPEN and not self._trial)
+
+    def acquire(self):
+        """Marks a call as sent, in half-open state it becomes the trial call."""
+        if self.state == self.HALF_OPEN:
+            self._trial = True
+
+    def release(self):
+        """Gives up a call without a result (e.g. cancelled), another trial call may be sent."""
+        self._trial = False
+
+    def on_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+
+    def on_failure(self):
+        self.failures += 1
+        if self._trial or self.failures >= self.failure_threshold:
+            self.opened_at = self.clock()
+            self._trial = False
@@ -0,0 +1,70 @@
+import uuid
+from typing import Optional
+
+from infra.r import r
+
+# 获取或续约租约: 租约空闲时递增 fencing token 并占用, 已是自己的租约则续期
+# 返回当前 fencing token, 被其它节点持有时返回 nil
+_ACQUIRE_SCRIPT = r.register_script(
+    """
+    local value = redis.call('GET', KEYS[1])
+    if not value then
+        local token = redis.call('INCR', KEYS[2])
+        redis.call('SET', KEYS[1], ARGV[1] .. ':' .. token, 'PX', ARGV[2])
+        return token
+    end
+    local owner, token = string.match(value, '^(.*):(%d+)$')
+    if owner == ARGV[1] then
+        redis.call('PEXPIRE', KEYS[1], ARGV[2])
+        return tonumber(token)
+    end
+    return nil
+    """
+)
+
+_RELEASE_SCRIPT = r.register_script(
+    """
+    if redis.call('GET', KEYS[1]) == ARGV[1] then
+        return redis.call('DEL', KEYS[1])
+    end
+    return 0
+    """
+)
+
+
+class LeaderLease:
+    """
+    Redis lease based leader election.
+
+    Every process calls `refresh()` periodically (well within `ttl`); the one
+    holding the lease is the leader until it stops renewing. Each new leader
+    gets a larger fencing token, and `value` ("owner:token") can be checked
+    atomically by other Redis scripts so a deposed leader can't act on stale
+    leadership.
+    """
+
+    def __init__(self, key: str, ttl: float = 15):
+        self.key = key
+        self.fence_key = f"{key}:fence"
+        self.ttl = ttl
+        self.owner = uuid.uuid4().hex
+        self.token: Optional[int] = None
+
+    @property
+    def is_leader(self) -> bool:
+        return self.token is not None
+
+    @property
+    def value(self) -> Optional[str]:
+        return f"{self.owner}:{self.token}" if self.is_leader else None
+
+    def refresh(self) -> bool:
+        """Acquires or renews the lease, returns whether this process is the leader."""
+        self.token = _ACQUIRE_SCRIPT(keys=[self.key, self.fence_key], args=[self.owner, int(self.ttl * 1000)])
+        return self.is_leader
+
+    def release(self):
+        """Gives up the lease so another process can take over immediately."""
+        if self.is_leader:
+            _RELEASE_SCRIPT(keys=[self.key], args=[self.value])
+            self.token = None
@@ -0,0 +1,48 @@
+class AIMDLimiter:
+    """
+    Additive-increase / multiplicative-decrease concurrency limit.
+
+    The limit grows by about one slot per "round" of successful tasks while
+    the queue actually uses all of its slots, and is cut by `backoff` when a
+    task fails or takes much longer than the latency baseline (a slow moving
+    average of past successes), which is how a saturated downstream server
+    shows up. The limit always stays within [min_limit, max_limit].
+    """
+
+    def __init__(
+        self,
+        min_limit: int = 1,
+        max_limit: int = 1,
+        initial_limit: int = None,
+        backoff: float = 0.5,
+        latency_tolerance: float = 2.0,
+        smoothing: float = 0.1,
+    ):
+        self.min_limit = min_limit
+        self.max_limit = max(min_limit, max_limit)
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.smoothing = smoothing
+        self.baseline = None
+        self._limit = float(self._clamp(initial_limit or min_limit))
+
+    def _clamp(self, value: float) -> float:
+        return max(self.min_limit, min(self.max_limit, value))
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    def on_success(self, latency: float, in_flight: int):
+        """Records a finished task, in_flight is the number of tasks running when it finished."""
+        if self.baseline is None:
+            self.baseline = latency
+        if latency > self.baseline * self.latency_tolerance:
+            self._limit = self._clamp(self._limit * self.backoff)
+        elif in_flight >= self.limit:
+            self._limit = self._clamp(self._limit + 1 / self._limit)
+        self.baseline += self.smoothing * (latency - self.baseline)
+
+    def on_error(self):
+        """Records a failed task."""
+        self._limit = self._clamp(self._limit * self.backoff)
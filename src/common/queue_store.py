@@ -0,0 +1,354 @@
+import json
+import time
+from typing import List, Optional, Sequence
+
+from infra.r import ar, r
+
+# notify 列表只用于唤醒消费者，保留的令牌数上限
+_NOTIFY_MAX_LEN = 100
+# 死信队列保留的最大条数
+_DEAD_MAX_LEN = 1000
+
+# 所有脚本共用的 KEYS 布局和辅助函数, 见 RedisQueueStore._keys
+_LUA_PRELUDE = """
+local tasks, leases, vtime, weights, lane_pass, notify, delayed, legacy_pending, leader, owners, dead =
+    KEYS[1], KEYS[2], KEYS[3], KEYS[4], KEYS[5], KEYS[6], KEYS[7], KEYS[8], KEYS[9], KEYS[10], KEYS[11]
+local lanes = #KEYS - 11
+
+local function ready(lane)
+    return KEYS[12 + lane]
+end
+
+local function clamp_lane(lane)
+    lane = tonumber(lane) or 1
+    if lane < 0 then
+        return 0
+    end
+    if lane >= lanes then
+        return lanes - 1
+    end
+    return lane
+end
+
+local function num(key, field)
+    return tonumber(redis.call('HGET', key, field) or '0')
+end
+
+-- 放回所属优先级通道的队首, 并唤醒消费者
+local function requeue_front(id)
+    local data = redis.call('HGET', tasks, id)
+    if not data then
+        return false
+    end
+    local lane = clamp_lane(cjson.decode(data)['priority'])
+    redis.call('ZADD', ready(lane), num(vtime, 'lane:' .. lane), id)
+    redis.call('RPUSH', notify, 1)
+    return true
+end
+"""
+
+# 入队: 按 start-time fair queuing 计算该用户在通道内的虚拟开始时间
+_ENQUEUE_SCRIPT = r.register_script(
+    _LUA_PRELUDE
+    + """
+    local id, lane, user = ARGV[1], clamp_lane(ARGV[3]), ARGV[4]
+    redis.call('HSET', tasks, id, ARGV[2])
+    local weight = tonumber(redis.call('HGET', weights, user) or '1')
+    local flow = 'flow:' .. lane .. ':' .. user
+    local start = math.max(num(vtime, 'lane:' .. lane), num(vtime, flow))
+    redis.call('HSET', vtime, flow, start + 1 / weight)
+    redis.call('ZADD', ready(lane), start, id)
+    redis.call('RPUSH', notify, 1)
+    redis.call('LTRIM', notify, -tonumber(ARGV[5]), -1)
+    """
+)
+
+# 原子地选出下一个任务并登记租约:
+# 通道之间按权重做 stride 调度, 通道内取虚拟开始时间最小的任务; hash 中已不存在的 id 直接跳过
+# ARGV[2] 不为空时, 只有 leader 租约的值与之相同(fencing)才能领取; ARGV[3] 记为租约的持有者
+_CLAIM_SCRIPT = r.register_script(
+    _LUA_PRELUDE
+    + """
+    if ARGV[2] ~= '' and redis.call('GET', leader) ~= ARGV[2] then
+        return nil
+    end
+    while true do
+        local global = num(lane_pass, 'global')
+        local best, best_pass = nil, nil
+        for lane = 0, lanes - 1 do
+            if redis.call('ZCARD', ready(lane)) > 0 then
+                local pass = math.max(num(lane_pass, lane), global)
+                if best == nil or pass < best_pass then
+                    best, best_pass = lane, pass
+                end
+            end
+        end
+        if best == nil then
+            return nil
+        end
+
+        local popped = redis.call('ZPOPMIN', ready(best))
+        local id, start = popped[1], tonumber(popped[2])
+        redis.call('HSET', lane_pass, 'global', best_pass)
+        redis.call('HSET', lane_pass, best, best_pass + 1 / tonumber(ARGV[4 + best]))
+        local lane_vtime = 'lane:' .. best
+        redis.call('HSET', vtime, lane_vtime, math.max(start, num(vtime, lane_vtime)))
+
+        local data = redis.call('HGET', tasks, id)
+        if data then
+            redis.call('ZADD', leases, ARGV[1], id)
+            redis.call('HSET', owners, id, ARGV[3])
+            return data
+        end
+    end
+    """
+)
+
+# 把租约已过期的任务放回队首
+_REQUEUE_EXPIRED_SCRIPT = r.register_script(
+    _LUA_PRELUDE
+    + """
+    local ids = redis.call('ZRANGEBYSCORE', leases, '-inf', ARGV[1])
+    for _, id in ipairs(ids) do
+        redis.call('ZREM', leases, id)
+        redis.call('HDEL', owners, id)
+        requeue_front(id)
+    end
+    redis.call('LTRIM', notify, -tonumber(ARGV[2]), -1)
+    return ids
+    """
+)
+
+# 仍是租约持有者时续约, 返回 0 表示租约已经失去(过期后被重新投递)
+_HEARTBEAT_SCRIPT = r.register_script(
+    _LUA_PRELUDE
+    + """
+    local id = ARGV[1]
+    if redis.call('HGET', owners, id) ~= ARGV[2] then
+        return 0
+    end
+    redis.call('ZADD', leases, 'XX', ARGV[3], id)
+    return 1
+    """
+)
+
+# 仍是租约持有者时结束任务: ack 删除, retry 放入延迟集合, dead 放入死信列表; 返回 0 表示租约已经失去
+_RELEASE_SCRIPT = r.register_script(
+    _LUA_PRELUDE
+    + """
+    local id, op = ARGV[1], ARGV[3]
+    if redis.call('HGET', owners, id) ~= ARGV[2] then
+        return 0
+    end
+    redis.call('ZREM', leases, id)
+    redis.call('HDEL', owners, id)
+    if op == 'retry' then
+        redis.call('HSET', tasks, id, ARGV[4])
+        redis.call('ZADD', delayed, ARGV[5], id)
+        return 1
+    end
+    redis.call('HDEL', tasks, id)
+    if op == 'dead' then
+        redis.call('LPUSH', dead, ARGV[4])
+        redis.call('LTRIM', dead, 0, tonumber(ARGV[5]) - 1)
+    end
+    return 1
+    """
+)
+
+# 把到期的延迟重试任务放回队首
+_PROMOTE_DUE_SCRIPT = r.register_script(
+    _LUA_PRELUDE
+    + """
+    local ids = redis.call('ZRANGEBYSCORE', delayed, '-inf', ARGV[1])
+    for _, id in ipairs(ids) do
+        redis.call('ZREM', delayed, id)
+        requeue_front(id)
+    end
+    redis.call('LTRIM', notify, -tonumber(ARGV[2]), -1)
+    return #ids
+    """
+)
+
+# 把旧版本的 pending 列表迁移到优先级通道
+_MIGRATE_PENDING_SCRIPT = r.register_script(
+    _LUA_PRELUDE
+    + """
+    local count = 0
+    while true do
+        local id = redis.call('LPOP', legacy_pending)
+        if not id then
+            return count
+        end
+        if requeue_front(id) then
+            count = count + 1
+        end
+    end
+    """
+)
+
+
+class RedisQueueStore:
+    """
+    Redis-native storage for TaskQueue.
+
+    Payloads live in a hash (task_id -> QTask json) and pending ids in one
+    sorted set per priority lane, all updated by Lua scripts so enqueue /
+    claim / ack are atomic and safe to share between multiple producers and
+    consumers.
+
+    Scheduling is weighted fair on two levels: lanes are picked by stride
+    scheduling with `lane_weights` (so low lanes still get their share), and
+    inside a lane tasks are ordered by start-time fair queuing per user, so a
+    burst from one user does not starve the others. User weights default to 1
+    and can be changed with `set_user_weight`.
+
+    A claimed task is moved into a lease sorted set (score = lease deadline)
+    until it is acked, so tasks held by a crashed consumer are re-delivered
+    once their lease expires. Each claim records an owner token; heartbeat,
+    ack, retry and dead-letter only succeed while that token still owns the
+    lease, so a consumer that lost its lease can't finish a re-delivered task.
+
+    Every enqueue also pushes a token to a notify list, idle consumers block
+    on it with BLPOP instead of polling.
+
+    Failed tasks wait for their retry in a delayed sorted set (score = due
+    time) without holding a consumer slot, tasks out of retries end up in a
+    capped dead-letter list.
+    """
+
+    def __init__(self, key: str, visibility_timeout: int = 60, lane_weights: Sequence[int] = (1,)):
+        self.key = key
+        self.visibility_timeout = visibility_timeout
+        self.lane_weights = list(lane_weights)
+        self.tasks_key = f"{key}:tasks"
+        self.leases_key = f"{key}:leases"
+        self.vtime_key = f"{key}:vtime"
+        self.weights_key = f"{key}:weights"
+        self.lane_pass_key = f"{key}:lane_pass"
+        self.notify_key = f"{key}:notify"
+        self.delayed_key = f"{key}:delayed"
+        self.dead_key = f"{key}:dead"
+        self.stats_key = f"{key}:stats"
+        self.leader_key = f"{key}:leader"
+        self.owners_key = f"{key}:owners"
+        self.ready_keys = [f"{key}:ready:{lane}" for lane in range(len(self.lane_weights))]
+        self._keys = [
+            self.tasks_key,
+            self.leases_key,
+            self.vtime_key,
+            self.weights_key,
+            self.lane_pass_key,
+            self.notify_key,
+            self.delayed_key,
+            f"{key}:pending",
+            self.leader_key,
+            self.owners_key,
+            self.dead_key,
+            *self.ready_keys,
+        ]
+        self._migrate_legacy()
+
+    def _migrate_legacy(self):
+        """Moves tasks from older layouts (whole-list json snapshot at `key`, plain pending list) into the lanes."""
+        if r.type(self.key) == b"string":
+            queue_data = json.loads(r.get(self.key) or b"[]")
+            pipe = r.pipeline(transaction=True)
+            for task in queue_data:
+                pipe.hsetnx(self.tasks_key, task["task_id"], json.dumps(task))
+                pipe.rpush(f"{self.key}:pending", task["task_id"])
+            pipe.delete(self.key)
+            pipe.execute()
+        _MIGRATE_PENDING_SCRIPT(keys=self._keys)
+
+    def size(self) -> int:
+        """Number of tasks waiting to be claimed."""
+        pipe = r.pipeline(transaction=False)
+        for ready_key in self.ready_keys:
+            pipe.zcard(ready_key)
+        return sum(pipe.execute())
+
+    def service_time(self) -> Optional[float]:
+        """Moving average of the handler duration in seconds, None before the first task finished."""
+        value = r.hget(self.stats_key, "service_time")
+        return float(value) if value is not None else None
+
+    def observe_service_time(self, seconds: float, alpha: float = 0.2):
+        """Folds one handler duration into the moving average."""
+        last = self.service_time()
+        value = seconds if last is None else alpha * seconds + (1 - alpha) * last
+        r.hset(self.stats_key, "service_time", value)
+
+    def set_user_weight(self, user_id: int, weight: float):
+        """Gives a user a larger (or smaller) share of the queue than the default weight 1."""
+        r.hset(self.weights_key, user_id, weight)
+
+    def push(self, task_id: int, data: dict):
+        """Stores the task payload and adds it to the lane of data["priority"] on behalf of data["user_id"]."""
+        _ENQUEUE_SCRIPT(
+            keys=self._keys,
+            args=[task_id, json.dumps(data), data.get("priority", 1), data.get("user_id", 0), _NOTIFY_MAX_LEN],
+        )
+
+    async def wait(self, timeout: float) -> bool:
+        """Blocks until a producer signals a new task or the timeout expires, returns True if signaled."""
+        return await ar.blpop([self.notify_key], timeout=timeout) is not None
+
+    def in_flight(self) -> int:
+        """Number of claimed tasks holding a lease."""
+        return r.zcard(self.leases_key)
+
+    def claim(self, owner: str, leader_value: Optional[str] = None) -> Optional[dict]:
+        """
+        Atomically takes the next pending task and leases it to `owner`, returns None if the queue is empty.
+        owner: 本次领取的唯一标识, 之后的 heartbeat / ack / schedule_retry / dead_letter 都要带上
+        leader_value: 若指定, 只有仍持有 leader_key 上的 LeaderLease 时才会领取
+        """
+        deadline = time.time() + self.visibility_timeout
+        data = _CLAIM_SCRIPT(keys=self._keys, args=[deadline, leader_value or "", owner, *self.lane_weights])
+        if data is None:
+            return None
+        return json.loads(data)
+
+    def heartbeat(self, task_id: int, owner: str) -> bool:
+        """Extends the lease of a claimed task, returns False if the lease has already been lost."""
+        deadline = time.time() + self.visibility_timeout
+        return _HEARTBEAT_SCRIPT(keys=self._keys, args=[task_id, owner, deadline]) == 1
+
+    def schedule_retry(self, task_id: int, owner: str, data: dict, delay: float) -> bool:
+        """Releases the lease and schedules the task to be re-queued after `delay` seconds, False if the lease was lost."""
+        args = [task_id, owner, "retry", json.dumps(data), time.time() + delay]
+        return _RELEASE_SCRIPT(keys=self._keys, args=args) == 1
+
+    def promote_due(self) -> int:
+        """Moves retries whose delay has elapsed back to the front of their lane, returns how many were moved."""
+        return _PROMOTE_DUE_SCRIPT(keys=self._keys, args=[time.time(), _NOTIFY_MAX_LEN])
+
+    def next_due_in(self) -> Optional[float]:
+        """Seconds until the next delayed retry is due, None if there is none."""
+        items = r.zrange(self.delayed_key, 0, 0, withscores=True)
+        if not items:
+            return None
+        return max(0.0, items[0][1] - time.time())
+
+    def delayed(self) -> int:
+        """Number of tasks waiting for a scheduled retry."""
+        return r.zcard(self.delayed_key)
+
+    def dead_letters(self) -> int:
+        """Number of tasks in the dead-letter list."""
+        return r.llen(self.dead_key)
+
+    def dead_letter(self, task_id: int, owner: str, data: dict) -> bool:
+        """Removes a task that ran out of retries and keeps it in the dead-letter list, False if the lease was lost."""
+        args = [task_id, owner, "dead", json.dumps(data), _DEAD_MAX_LEN]
+        return _RELEASE_SCRIPT(keys=self._keys, args=args) == 1
+
+    def ack(self, task_id: int, owner: str) -> bool:
+        """Removes a finished task together with its lease, False if the lease was lost."""
+        return _RELEASE_SCRIPT(keys=self._keys, args=[task_id, owner, "ack"]) == 1
+
+    def requeue_expired(self) -> List[int]:
+        """Re-delivers tasks whose lease expired (the consumer died or stalled), returns their ids."""
+        ids = _REQUEUE_EXPIRED_SCRIPT(keys=self._keys, args=[time.time(), _NOTIFY_MAX_LEN])
+        return [int(task_id) for task_id in ids]
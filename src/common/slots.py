@@ -0,0 +1,143 @@
+import time
+from typing import Callable, List, Optional, Sequence
+
+from infra.r import ar, r
+
+# notify 列表只用于唤醒等待者，保留的令牌数上限
+_NOTIFY_MAX_LEN = 100
+
+# 先回收过期的槽位; 任务已持有槽位时续期并返回该副本(重试幂等)
+# 否则优先使用 ARGV[5] 指定的副本, 其次选空闲槽位最多的副本, 都没有空闲时返回 nil
+_ACQUIRE_SCRIPT = r.register_script(
+    """
+    local now, deadline, id = tonumber(ARGV[1]), ARGV[2], ARGV[3]
+    local capacity, preferred = tonumber(ARGV[4]), tonumber(ARGV[5])
+    for i = 1, #KEYS do
+        redis.call('ZREMRANGEBYSCORE', KEYS[i], '-inf', now)
+        if redis.call('ZSCORE', KEYS[i], id) then
+            redis.call('ZADD', KEYS[i], deadline, id)
+            return i
+        end
+    end
+    local best, best_free = nil, 0
+    if preferred > 0 and capacity - redis.call('ZCARD', KEYS[preferred]) > 0 then
+        best = preferred
+    else
+        for i = 1, #KEYS do
+            local free = capacity - redis.call('ZCARD', KEYS[i])
+            if free > best_free then
+                best, best_free = i, free
+            end
+        end
+    end
+    if best == nil then
+        return nil
+    end
+    redis.call('ZADD', KEYS[best], deadline, id)
+    return best
+    """
+)
+
+
+class SlotManager:
+    """
+    Cluster-wide job slots for GPU servers that accept a limited number of
+    concurrent jobs and report completion through a callback.
+
+    Every replica has a sorted set of the task ids holding one of its slots
+    (score = reclaim deadline). `acquire` takes a free slot atomically or
+    blocks on a notify list until `release` (called from the callback) frees
+    one; slots whose callback never arrives are reclaimed after their lease
+    timeout. Queues that only claim work while a slot is free register their
+    notify list with `notify_on_release`, so a release wakes them at once.
+    """
+
+    def __init__(self, name: str, replicas: Sequence[str], capacity: int = 1, poll_interval: float = 5):
+        self.name = name
+        self.replicas = list(replicas)
+        self.capacity = capacity
+        self.poll_interval = poll_interval
+        self.notify_key = f"gpu_slots:{name}:notify"
+        self.listeners_key = f"gpu_slots:{name}:listeners"
+
+    def _key(self, replica: str) -> str:
+        return f"gpu_slots:{self.name}:{replica}"
+
+    @property
+    def total_capacity(self) -> int:
+        return self.capacity * len(self.replicas)
+
+    def try_acquire(
+        self, task_id: int, lease_timeout: float, candidates: List[str], preferred: Optional[str] = None
+    ) -> Optional[str]:
+        """Takes a free slot on one of `candidates` without waiting, returns the replica or None."""
+        if not candidates:
+            return None
+        now = time.time()
+        index = _ACQUIRE_SCRIPT(
+            keys=[self._key(replica) for replica in candidates],
+            args=[
+                now,
+                now + lease_timeout,
+                task_id,
+                self.capacity,
+                candidates.index(preferred) + 1 if preferred in candidates else 0,
+            ],
+        )
+        return None if index is None else candidates[index - 1]
+
+    async def acquire(
+        self,
+        task_id: int,
+        lease_timeout: float,
+        candidates: Callable[[], List[str]] = None,
+        preferred: Optional[str] = None,
+    ) -> str:
+        """
+        等待空闲槽位, 返回分配的副本
+        lease_timeout: 超过该时间没有 release 时槽位被回收
+        candidates: 返回当前可以使用的副本(例如健康的副本), 默认所有副本
+        preferred: 有空闲槽位时优先使用的副本
+        """
+        while True:
+            replica = self.try_acquire(
+                task_id, lease_timeout, candidates() if candidates else self.replicas, preferred
+            )
+            if replica is not None:
+                return replica
+            # 有槽位释放时被唤醒, 同时定期重试以回收过期的槽位
+            await ar.blpop([self.notify_key], timeout=self.poll_interval)
+
+    def notify_on_release(self, notify_key: str):
+        """Also pushes a token to `notify_key` on every release, kept in redis so any process's release reaches it."""
+        r.sadd(self.listeners_key, notify_key)
+
+    def release(self, task_id: int) -> bool:
+        """Frees the slot held by the task, wakes one waiter and the listening queues, returns False if it held none."""
+        pipe = r.pipeline(transaction=False)
+        for replica in self.replicas:
+            pipe.zrem(self._key(replica), task_id)
+        if not any(pipe.execute()):
+            return False
+        listeners = [key.decode() for key in r.smembers(self.listeners_key)]
+        pipe = r.pipeline(transaction=False)
+        for key in (self.notify_key, *listeners):
+            pipe.rpush(key, 1)
+            pipe.ltrim(key, -_NOTIFY_MAX_LEN, -1)
+        pipe.execute()
+        return True
+
+    def free(self, candidates: List[str] = None) -> int:
+        """Number of free slots on `candidates` (default all replicas), expired slots count as free."""
+        candidates = self.replicas if candidates is None else candidates
+        pipe = r.pipeline(transaction=False)
+        for replica in candidates:
+            pipe.zcount(self._key(replica), time.time(), "+inf")
+        return sum(max(0, self.capacity - held) for held in pipe.execute())
+
+    def in_use(self) -> int:
+        """Number of slots currently held, including ones waiting to be reclaimed."""
+        pipe = r.pipeline(transaction=False)
+        for replica in self.replicas:
+            pipe.zcard(self._key(replica))
+        return sum(pipe.execute())
@@ -1,22 +1,88 @@
 import asyncio
-import json
-from typing import Callable, Union
+import math
+import os
+import random
+import time
+import uuid
+from enum import Enum
+from typing import Callable, Dict, List, Optional, Union
 
-from infra.r import r
+from common.leader import LeaderLease
+from common.limiter import AIMDLimiter
+from common.queue_store import RedisQueueStore
+from infra.config import TASK_QUEUE_CAPACITY
+from infra.events import publish_task_event
 from infra.logger import logger
-from models.task import Task, TaskStatus, create_task, query_task, update_task
+from infra.metrics import Histogram, gauge_lines, register_collector
+from models.task import FINISHED_STATUSES, Task, TaskStatus, create_task, modify_task, query_task
+
+
+class TaskPriority(int, Enum):
+    HIGH = 0  # 交互式的短任务
+    NORMAL = 1
+    LOW = 2  # 批量任务
+
+
+DEFAULT_LANE_WEIGHTS = {
+    TaskPriority.HIGH: 4,
+    TaskPriority.NORMAL: 2,
+    TaskPriority.LOW: 1,
+}
+
+
+# 还没有处理完成过任务时, 估算 Retry-After 用的处理时长
+DEFAULT_SERVICE_TIME = 10
+
+
+# 所有已创建的队列, name -> TaskQueue
+task_queues: Dict[str, "TaskQueue"] = {}
+
+queue_wait_seconds = Histogram("mercury_queue_wait_seconds", "Time a task waited in the queue before it was claimed")
+task_service_seconds = Histogram("mercury_task_service_seconds", "Handler duration of queued tasks")
+
+
+class QueueFullError(Exception):
+    """Raised when a queue is at capacity, retry_after is the estimated seconds until it has room."""
+
+    def __init__(self, name: str, retry_after: int):
+        super().__init__(f"队列 {name} 超出最大长度限制")
+        self.name = name
+        self.retry_after = retry_after
 
 
 class QTask:
-    def __init__(self, task_id: int, payload: str, max_retry: int = 0):
+    def __init__(
+        self,
+        task_id: int,
+        payload: str,
+        max_retry: int = 0,
+        user_id: int = 0,
+        priority: TaskPriority = TaskPriority.NORMAL,
+    ):
         self.payload = payload
         self.task_id = task_id
         self.retry_count = 0
         self.max_retry = max_retry
+        self.user_id = user_id
+        self.priority = priority
+        # 进入待处理队列的时间, 用于统计排队耗时
+        self.enqueued_at = time.time()
+        # 本次领取的租约持有者标识, 只在本进程内使用, 不写入 redis 的任务数据
+        self.lease_owner = None
+        self.lease_lost = False
 
     @classmethod
     def from_json(cls, j):
-        return cls(task_id=j["task_id"], payload=j["payload"], max_retry=j["max_retry"])
+        qtask = cls(
+            task_id=j["task_id"],
+            payload=j["payload"],
+            max_retry=j["max_retry"],
+            user_id=j.get("user_id", 0),
+            priority=TaskPriority(j.get("priority", TaskPriority.NORMAL)),
+        )
+        qtask.retry_count = j.get("retry_count", 0)
+        qtask.enqueued_at = j.get("enqueued_at", qtask.enqueued_at)
+        return qtask
 
     def to_dict(self):
         return {
@@ -24,6 +90,9 @@ class QTask:
             "task_id": self.task_id,
             "retry_count": self.retry_count,
             "max_retry": self.max_retry,
+            "user_id": self.user_id,
+            "priority": int(self.priority),
+            "enqueued_at": self.enqueued_at,
         }
 
 
@@ -34,88 +103,356 @@ class TaskQueue:
         handler: Callable[[int, any], Union[TaskStatus, None]],
         handle_sleep: int = 5,
         retry_sleep: int = 5,
+        retry_max_sleep: int = 300,
         max_parallel_tasks: int = 1,
+        min_parallel_tasks: int = 1,
+        visibility_timeout: int = 60,
+        idle_timeout: int = 5,
+        lane_weights: Dict[TaskPriority, int] = None,
+        capacity: int = None,
+        exclusive: bool = False,
+        free_slots: Optional[Callable[[], int]] = None,
     ):
         """
         name: 区分任务队列
         handler: 处理任务的方法
         handle_sleep: 上一个任务完成后，开始下一个任务的时间间隔
-        retry_sleep: 处理失败后，重试的时间间隔
+        retry_sleep: 处理失败后，第一次重试的时间间隔，之后按指数退避(带随机抖动)
+        retry_max_sleep: 重试间隔的上限
+        max_parallel_tasks: 初始并发数，并发上限默认也取这个值，可以用 TASK_QUEUE_MAX_PARALLEL_<name> 调大
+        min_parallel_tasks: 并发下限，可以用 TASK_QUEUE_MIN_PARALLEL_<name> 设置
+            并发数在上下限之间根据处理耗时和失败情况自适应调整(AIMD)
+        visibility_timeout: 任务租约时长，处理过程中会定期续约，进程退出后租约过期的任务会被重新投递
+        idle_timeout: 没有收到新任务通知时，最长的等待时间(到期后会检查过期租约)
+        lane_weights: 各优先级通道的调度权重，通道内按 user_id 公平调度
+        capacity: 等待中任务数的上限，默认读取 TASK_QUEUE_CAPACITY_<name> / TASK_QUEUE_CAPACITY
+        exclusive: 整个集群同时只能处理一个任务(独占 GPU 的队列)，通过 redis 选举出唯一的消费者
+        free_slots: 返回下游资源(如 GPU 槽位)的空闲数，每轮领取的任务数不超过它，避免任务领取后占着租约排队等待资源
+            资源释放时应向 store.notify_key 推送通知(见 SlotManager.notify_on_release)，否则最迟 idle_timeout 后重新检查
         """
         self.name = name
         self.handler = handler
         self.handle_sleep = handle_sleep
         self.retry_sleep = retry_sleep
+        self.retry_max_sleep = retry_max_sleep
+        self.visibility_timeout = visibility_timeout
+        self.idle_timeout = idle_timeout
+        self.capacity = capacity or int(os.getenv(f"TASK_QUEUE_CAPACITY_{name}", TASK_QUEUE_CAPACITY))
         self.key = self._generate_key()
-        self.task_list = self._get_queue()
-        self.max_parallel_tasks = max_parallel_tasks
+        self.lane_weights = {**DEFAULT_LANE_WEIGHTS, **(lane_weights or {})}
+        self.store = RedisQueueStore(
+            self.key,
+            visibility_timeout=visibility_timeout,
+            lane_weights=[self.lane_weights[priority] for priority in TaskPriority],
+        )
+        self.min_parallel_tasks = int(os.getenv(f"TASK_QUEUE_MIN_PARALLEL_{name}", min_parallel_tasks))
+        self.max_parallel_tasks = int(os.getenv(f"TASK_QUEUE_MAX_PARALLEL_{name}", max_parallel_tasks))
+        self.leader = None
+        if exclusive:
+            self.min_parallel_tasks = self.max_parallel_tasks = max_parallel_tasks = 1
+            # 消费循环至少每 idle_timeout 续约一次
+            self.leader = LeaderLease(self.store.leader_key, ttl=idle_timeout * 3)
+        self.free_slots = free_slots
+        self.limiter = AIMDLimiter(
+            min_limit=self.min_parallel_tasks,
+            max_limit=self.max_parallel_tasks,
+            initial_limit=max_parallel_tasks,
+        )
         self.active_tasks = []
+        self.cooling_slots = 0
+        self._slot_freed = None
+        self._wakeup = None
+        self._consumer = None
+        task_queues[name] = self
 
     def _generate_key(self):
         """Generates a unique key for the queue."""
         return f"rqueue_{self.name}"
 
-    def _get_queue(self):
-        """Retrieves the queue from the redis."""
-        queue_data_b = r.get(self.key) or b"[]"
-        queue_data = json.loads(queue_data_b)
-        return [QTask.from_json(task) for task in queue_data]
+    def _claim(self):
+        """Claims the next task from the redis queue."""
+        owner = uuid.uuid4().hex
+        data = self.store.claim(owner, self.leader.value if self.leader else None)
+        if not data:
+            return None
+        qtask = QTask.from_json(data)
+        qtask.lease_owner = owner
+        queue_wait_seconds.observe(max(0.0, time.time() - qtask.enqueued_at), queue=self.name)
+        return qtask
+
+    def _refresh_leader(self) -> bool:
+        """Renews leadership of an exclusive queue, always True for normal queues."""
+        if self.leader is None:
+            return True
+        was_leader = self.leader.is_leader
+        is_leader = self.leader.refresh()
+        if is_leader and not was_leader:
+            logger.info("queue %s became leader, fencing token: %s", self.name, self.leader.token)
+        elif was_leader and not is_leader:
+            logger.warning("queue %s lost leadership", self.name)
+        return is_leader
 
-    def __set_queue(self):
-        """Updates the queue in the redis."""
-        r.set(self.key, json.dumps([task.to_dict() for task in self.task_list]), ex=None)
+    def _requeue_expired(self):
+        """Re-delivers tasks whose lease expired."""
+        task_ids = self.store.requeue_expired()
+        if task_ids:
+            logger.warning("queue %s re-delivered tasks with expired lease: %s", self.name, task_ids)
+
+    async def _heartbeat(self, qtask: QTask, runner: asyncio.Task):
+        """Keeps the lease of a running task alive, cancels the runner once the lease is lost."""
+        while True:
+            await asyncio.sleep(self.visibility_timeout / 3)
+            if not self.store.heartbeat(qtask.task_id, qtask.lease_owner):
+                # 任务已被重新投递给其它消费者, 不再继续处理
+                logger.warning("queue %s lost the lease of task %s, cancel it", self.name, qtask.task_id)
+                qtask.lease_lost = True
+                runner.cancel()
+                return
 
     def schedule_task_processing(self):
         """Schedules the task processing in a separate thread or process."""
-        asyncio.create_task(self._process_tasks())
+        self._consumer = asyncio.create_task(self._process_tasks())
+
+    async def stop(self, timeout: float = 30):
+        """Stops claiming new tasks and waits up to `timeout` for running ones, unfinished ones are re-delivered later."""
+        if self._consumer is None:
+            return
+        self._consumer.cancel()
+        self._consumer = None
+        if self.active_tasks:
+            _, pending = await asyncio.wait(list(self.active_tasks), timeout=timeout)
+            for task in pending:
+                task.cancel()
+        if self.leader:
+            self.leader.release()
+
+    def _has_free_slot(self) -> bool:
+        return len(self.active_tasks) + self.cooling_slots < self.limiter.limit
+
+    def _claim_budget(self) -> int:
+        """How many tasks may be claimed now: free local slots, capped by the free downstream slots."""
+        budget = self.limiter.limit - len(self.active_tasks) - self.cooling_slots
+        if budget > 0 and self.free_slots is not None:
+            budget = min(budget, self.free_slots())
+        return budget
+
+    def _wait_timeout(self) -> float:
+        """Waits at most idle_timeout, or less if a delayed retry becomes due earlier."""
+        next_due = self.store.next_due_in()
+        if next_due is None:
+            return self.idle_timeout
+        # BLPOP 的 timeout 为 0 表示永久阻塞
+        return max(0.1, min(self.idle_timeout, next_due))
+
+    async def _wait_for_notify(self, timeout: float):
+        """Waits for a producer notification, or a local wakeup (e.g. a retry was scheduled) so the timeout is recomputed."""
+        self._wakeup.clear()
+        notified = asyncio.ensure_future(self.store.wait(timeout))
+        woken = asyncio.ensure_future(self._wakeup.wait())
+        try:
+            await asyncio.wait({notified, woken}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            notified.cancel()
+            woken.cancel()
 
     async def _process_tasks(self):
         """Processes tasks in the queue."""
+        # 在事件循环内创建, 避免绑定到导入时的 loop
+        self._slot_freed = asyncio.Event()
+        self._wakeup = asyncio.Event()
         while True:
-            if len(self.task_list) == 0:
-                await asyncio.sleep(5)
+            self._requeue_expired()
+            self.store.promote_due()
+
+            if not self._refresh_leader():
+                # 不是 leader, 不领取任务, 也不消费唤醒通知
+                await asyncio.sleep(self.idle_timeout)
                 continue
 
-            while len(self.active_tasks) < self.max_parallel_tasks and self.task_list:
-                qtask = self.task_list.pop(0)
+            budget = self._claim_budget()
+            while budget > 0:
+                qtask = self._claim()
+                if qtask is None:
+                    break
                 task = asyncio.create_task(self._process_single_task(qtask))
                 self.active_tasks.append(task)
-                task.add_done_callback(lambda t: self.active_tasks.remove(t))
+                task.add_done_callback(self._on_task_done)
+                budget -= 1
 
-            await asyncio.sleep(1)
+            if self._has_free_slot():
+                # 队列已空或下游没有空闲资源, 等待新任务或资源释放的通知
+                await self._wait_for_notify(self._wait_timeout())
+            else:
+                # 并发已满, 等待本地任务完成
+                self._slot_freed.clear()
+                try:
+                    await asyncio.wait_for(self._slot_freed.wait(), timeout=self._wait_timeout())
+                except asyncio.TimeoutError:
+                    pass
+
+    def _on_task_done(self, task: asyncio.Task):
+        self.active_tasks.remove(task)
+        self._slot_freed.set()
+
+    def _start_cooldown(self):
+        """Keeps a slot reserved for handle_sleep seconds without holding a running task."""
+        if self.handle_sleep <= 0:
+            return
+        self.cooling_slots += 1
+        asyncio.get_running_loop().call_later(self.handle_sleep, self._end_cooldown)
+
+    def _end_cooldown(self):
+        self.cooling_slots -= 1
+        self._slot_freed.set()
+
+    def _adjust_limit(self, update, *args):
+        limit = self.limiter.limit
+        update(*args)
+        if self.limiter.limit != limit:
+            logger.debug("queue %s parallel limit: %s -> %s", self.name, limit, self.limiter.limit)
+            self._slot_freed.set()
+
+    def _retry_delay(self, retry_count: int) -> float:
+        """Exponential backoff with jitter, so retries against the same server are spread out."""
+        delay = min(self.retry_max_sleep, self.retry_sleep * 2 ** (retry_count - 1))
+        return random.uniform(delay / 2, delay)
 
     async def _process_single_task(self, qtask: QTask):
+        heartbeat = asyncio.create_task(self._heartbeat(qtask, asyncio.current_task()))
+        try:
+            await self._run_task(qtask)
+        except asyncio.CancelledError:
+            if not qtask.lease_lost:
+                raise
+        finally:
+            heartbeat.cancel()
+
+    async def _run_task(self, qtask: QTask):
         try:
             logger.debug("processing task: %s", qtask.to_dict())
+            await publish_task_event(qtask.task_id, "started", queue=self.name, retry_count=qtask.retry_count)
+
+            started = time.monotonic()
+            try:
+                task_status = await self.handler(qtask.task_id, qtask.payload)
+            except Exception:
+                task_service_seconds.observe(time.monotonic() - started, queue=self.name, status="error")
+                self._adjust_limit(self.limiter.on_error)
+                raise
+            latency = time.monotonic() - started
+            task_service_seconds.observe(latency, queue=self.name, status="ok")
+            self.store.observe_service_time(latency)
+            self._adjust_limit(self.limiter.on_success, latency, len(self.active_tasks))
+            # 先确认仍持有租约并写入状态, 再 ack; 写入失败时任务还在队列中, 按失败重试
+            if not self.store.heartbeat(qtask.task_id, qtask.lease_owner):
+                logger.warning("queue %s lost the lease of task %s, skip finishing it", self.name, qtask.task_id)
+                return
+            status = task_status if task_status else TaskStatus.SUCCEEDED
 
-            task_status = await self.handler(qtask.task_id, qtask.payload)
-            await update_task(qtask.task_id, status=task_status if task_status else TaskStatus.SUCCEEDED)
+            def finish(task: Task):
+                # 下游回调可能已经先把任务标记为结束, 不能再改回 PENDING
+                return None if task.status in FINISHED_STATUSES else {"status": status}
 
-            self.__set_queue()
+            await modify_task(qtask.task_id, finish)
+            if not self.store.ack(qtask.task_id, qtask.lease_owner):
+                logger.warning("queue %s lost the lease of task %s before ack", self.name, qtask.task_id)
+                return
             logger.debug("process task success: %s", qtask.task_id)
-            await asyncio.sleep(self.handle_sleep)
+            self._start_cooldown()
         except Exception as e:
             logger.error("process task error, task: %s, error: %s", qtask.to_dict(), e)
             qtask.retry_count += 1
             if qtask.retry_count > qtask.max_retry:
-                tasks = await query_task(task_id=qtask.task_id)
-                if len(tasks) == 1:
-                    task = tasks[0]
-                    res = task.res
-                    res["message"] = str(e)
-                    await update_task(qtask.task_id, status=TaskStatus.FAILED, res=res)
+                if not self.store.heartbeat(qtask.task_id, qtask.lease_owner):
+                    logger.warning("queue %s lost the lease of task %s, skip dead-letter", self.name, qtask.task_id)
+                    return
+                message = str(e)
+
+                def fail(task: Task):
+                    return {"status": TaskStatus.FAILED, "res": {**(task.res or {}), "message": message}}
+
+                try:
+                    if await query_task(task_id=qtask.task_id):
+                        await modify_task(qtask.task_id, fail)
+                except Exception as write_error:
+                    # 状态没有写入时不移出队列, 租约过期后重新投递
+                    logger.error("queue %s failed to mark task %s failed: %s", self.name, qtask.task_id, write_error)
+                    return
+                if not self.store.dead_letter(qtask.task_id, qtask.lease_owner, {**qtask.to_dict(), "error": message}):
+                    logger.warning("queue %s lost the lease of task %s, skip dead-letter", self.name, qtask.task_id)
             else:
-                self.task_list.append(qtask)
-            self.__set_queue()
-            await asyncio.sleep(self.retry_sleep)
-
-    async def append(self, payload: str, max_retry: int = 0) -> Task:
-        """Appends a new task to the queue. return model Task"""
-        if len(self.task_list) >= 10:
-            raise Exception("队列超出最大长度限制")
-        task = await create_task()
-        qt = QTask(task_id=task.id, payload=payload, max_retry=max_retry)
-
-        self.task_list.append(qt)
-        self.__set_queue()
+                delay = self._retry_delay(qtask.retry_count)
+                logger.debug("retry task %s in %.1fs", qtask.task_id, delay)
+                qtask.enqueued_at = time.time() + delay
+                if not self.store.schedule_retry(qtask.task_id, qtask.lease_owner, qtask.to_dict(), delay):
+                    logger.warning("queue %s lost the lease of task %s, skip retry", self.name, qtask.task_id)
+                    return
+                # 空闲的消费循环可能正按旧的超时阻塞, 唤醒它按新的到期时间重新计算
+                self._wakeup.set()
+                await publish_task_event(qtask.task_id, "retry", queue=self.name, delay=delay, error=str(e))
+
+    def retry_after(self) -> int:
+        """Estimates how many seconds until the queue drains enough to accept a new task."""
+        service_time = self.store.service_time() or DEFAULT_SERVICE_TIME
+        backlog = self.store.size() - self.capacity + 1
+        return max(1, math.ceil(backlog * service_time / self.limiter.limit))
+
+    def check_capacity(self):
+        """Raises QueueFullError if the queue can't take another task, call it before creating any rows."""
+        if self.store.size() >= self.capacity:
+            raise QueueFullError(self.name, self.retry_after())
+
+    async def append(
+        self,
+        payload: str,
+        max_retry: int = 0,
+        user_id: int = 0,
+        priority: TaskPriority = TaskPriority.NORMAL,
+        task: Task = None,
+    ) -> Task:
+        """
+        Appends a new task to the queue. return model Task
+        task: 已创建好的 Task, 用于先写好 task.res 再入队, 调用方需要先调用 check_capacity
+        """
+        if task is None:
+            self.check_capacity()
+            task = await create_task()
+        qt = QTask(task_id=task.id, payload=payload, max_retry=max_retry, user_id=user_id, priority=priority)
+
+        self.store.push(qt.task_id, qt.to_dict())
+        await publish_task_event(qt.task_id, "queued", queue=self.name)
         return task
+
+
+def _collect_queue_metrics():
+    queues = list(task_queues.values())
+    gauges = [
+        ("mercury_queue_depth", "Tasks waiting to be claimed", lambda q: q.store.size()),
+        ("mercury_queue_in_flight", "Claimed tasks holding a lease", lambda q: q.store.in_flight()),
+        ("mercury_queue_retry_backlog", "Tasks waiting for a scheduled retry", lambda q: q.store.delayed()),
+        ("mercury_queue_dead_letters", "Tasks in the dead-letter list", lambda q: q.store.dead_letters()),
+    ]
+    for name, documentation, read in gauges:
+        yield from gauge_lines(name, documentation, [({"queue": q.name}, read(q)) for q in queues])
+
+
+register_collector(_collect_queue_metrics)
+
+
+def start_consumers(names: str) -> List[TaskQueue]:
+    """
+    Starts consuming the given queues in this process.
+    names: 逗号分隔的队列名，"*" 表示所有队列，空字符串表示不消费任何队列
+    """
+    names = [name.strip() for name in names.split(",") if name.strip()]
+    if "*" in names:
+        names = list(task_queues)
+    unknown = [name for name in names if name not in task_queues]
+    if unknown:
+        raise ValueError(f"unknown task queues: {unknown}, available: {list(task_queues)}")
+
+    queues = [task_queues[name] for name in names]
+    for queue in queues:
+        queue.schedule_task_processing()
+    logger.info("consuming task queues: %s", names)
+    return queues
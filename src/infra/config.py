@@ -9,3 +9,60 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 AZURE_SPEECH_KEY = os.getenv("AZURE_SPEECH_KEY")
 AZURE_SPEECH_REGION = os.getenv("AZURE_SPEECH_REGION")
 REDIS_URL = os.getenv("REDIS_URL")
+
+# 任务队列默认容量(等待中的任务数), 可以用 TASK_QUEUE_CAPACITY_<队列名> 单独设置
+TASK_QUEUE_CAPACITY = int(os.getenv("TASK_QUEUE_CAPACITY", "10"))
+
+# API 进程里要消费的任务队列, 逗号分隔, "*" 表示全部; 使用独立 worker 进程(python -m worker)时设为空
+TASK_CONSUMER_QUEUES = os.getenv("TASK_CONSUMER_QUEUES", "*")
+
+# TTS/RVC 推理结果缓存
+INFER_CACHE_ENABLED = os.getenv("INFER_CACHE_ENABLED", "true").lower() == "true"
+INFER_CACHE_TTL = int(os.getenv("INFER_CACHE_TTL", str(7 * 24 * 60 * 60)))
+INFER_CACHE_MAX_ENTRIES = int(os.getenv("INFER_CACHE_MAX_ENTRIES", "10000"))
+
+# 长文本按句切分后并发合成: 单个片段的最大字符数、同时合成的片段数、单个片段失败后的重试次数
+TTS_CHUNK_MAX_LEN = int(os.getenv("TTS_CHUNK_MAX_LEN", "120"))
+TTS_CHUNK_PARALLELISM = int(os.getenv("TTS_CHUNK_PARALLELISM", "4"))
+TTS_CHUNK_RETRIES = int(os.getenv("TTS_CHUNK_RETRIES", "2"))
+# 流式合成(/infer/text2audio/stream)的片段更短, 第一句能更快返回
+TTS_STREAM_CHUNK_MAX_LEN = int(os.getenv("TTS_STREAM_CHUNK_MAX_LEN", "50"))
+# 每个 API 进程同时进行的流式合成数上限, 超出时返回 429
+TTS_STREAM_MAX_CONCURRENT = int(os.getenv("TTS_STREAM_MAX_CONCURRENT", "8"))
+
+# 下游服务回调 /internal/task/{task_id} 时使用的本服务地址
+INTERNAL_CALLBACK_URL = os.getenv("INTERNAL_CALLBACK_URL", "http://0.0.0.0:3333")
+
+# 下游服务副本的主动健康检查间隔(秒, 0 表示不检查)和超时, 以及每个副本的熔断: 连续失败次数、熔断时长(秒)
+DOWNSTREAM_HEALTH_INTERVAL = float(os.getenv("DOWNSTREAM_HEALTH_INTERVAL", "10"))
+DOWNSTREAM_HEALTH_TIMEOUT = float(os.getenv("DOWNSTREAM_HEALTH_TIMEOUT", "2"))
+DOWNSTREAM_BREAKER_FAILURES = int(os.getenv("DOWNSTREAM_BREAKER_FAILURES", "5"))
+DOWNSTREAM_BREAKER_COOLDOWN = float(os.getenv("DOWNSTREAM_BREAKER_COOLDOWN", "30"))
+# 模型亲和: 上次处理过该模型的副本负载不超过平均值的该倍数时优先使用
+DOWNSTREAM_AFFINITY_LOAD_FACTOR = float(os.getenv("DOWNSTREAM_AFFINITY_LOAD_FACTOR", "1.25"))
+
+# 每个 talking-head 副本同时运行的任务数(推理和训练共用), 以及没有收到回调时回收槽位的时间(秒)
+TALKING_HEAD_SLOTS = int(os.getenv("TALKING_HEAD_SLOTS", "1"))
+TALKING_HEAD_INFER_SLOT_TIMEOUT = int(os.getenv("TALKING_HEAD_INFER_SLOT_TIMEOUT", str(60 * 60)))
+TALKING_HEAD_TRAIN_SLOT_TIMEOUT = int(os.getenv("TALKING_HEAD_TRAIN_SLOT_TIMEOUT", str(12 * 60 * 60)))
+
+# Azure TTS: 合成线程数、每个音色保留的已连接 synthesizer 数, 以及启动时预先连接的音色(逗号分隔)
+AZURE_TTS_THREADS = int(os.getenv("AZURE_TTS_THREADS", "8"))
+AZURE_TTS_POOL_SIZE = int(os.getenv("AZURE_TTS_POOL_SIZE", "4"))
+AZURE_TTS_WARM_VOICES = os.getenv("AZURE_TTS_WARM_VOICES", "zh-CN-YunxiNeural")
+# 中间音频(如 RVC 之前的 Azure 音频)在内存中拼接, 只写一次给下游读取, 用完即删
+# 默认写到输出目录; RVC 与本服务在同一台机器时可设为 /dev/shm 等 tmpfs 目录, 不落盘
+INFER_SCRATCH_DIR = os.getenv("INFER_SCRATCH_DIR", "")
+# celery 部署时 azure worker 是否把合成的中间音频上传 COS, 需要与 azure worker 的设置一致
+# 为 false 时中间音频只留在共享的 /cos 目录, 不再为它创建 File 记录
+AZURE_UPLOAD_OUTPUT = os.getenv("AZURE_UPLOAD_OUTPUT", "true").lower() != "false"
+
+# 长音频识别字幕(/infer/audio2srt)时在静音处切成约 ASR_SEGMENT_SECONDS 秒的片段, 最多 ASR_SEGMENT_PARALLELISM 个同时识别
+# 单个片段识别失败后重试 ASR_SEGMENT_RETRIES 次
+ASR_SEGMENT_SECONDS = float(os.getenv("ASR_SEGMENT_SECONDS", "60"))
+ASR_SEGMENT_PARALLELISM = int(os.getenv("ASR_SEGMENT_PARALLELISM", "4"))
+ASR_SEGMENT_RETRIES = int(os.getenv("ASR_SEGMENT_RETRIES", "2"))
+
+# 训练时在本进程切分参考音频(只支持 PCM WAV, 其它格式仍交给 audio 服务), 切分使用的进程数, 0 为 CPU 核数
+AUDIO_SLICE_LOCAL = os.getenv("AUDIO_SLICE_LOCAL", "true").lower() == "true"
+AUDIO_SLICE_WORKERS = int(os.getenv("AUDIO_SLICE_WORKERS", "0"))
@@ -0,0 +1,325 @@
+import asyncio
+import math
+import os
+import random
+from typing import Dict, List, Optional
+
+import httpx
+from redis.exceptions import RedisError
+
+from common.breaker import CircuitBreaker
+from infra.config import (
+    DOWNSTREAM_AFFINITY_LOAD_FACTOR,
+    DOWNSTREAM_BREAKER_COOLDOWN,
+    DOWNSTREAM_BREAKER_FAILURES,
+    DOWNSTREAM_HEALTH_INTERVAL,
+    DOWNSTREAM_HEALTH_TIMEOUT,
+)
+from infra.logger import logger
+from infra.metrics import gauge_lines, register_collector
+from infra.r import r
+
+# 默认的连接超时(秒), 读超时和总时限按接口设置
+DEFAULT_CONNECT_TIMEOUT = 5
+
+
+class DownstreamTimeoutError(Exception):
+    def __init__(self, endpoint: str, timeout: float):
+        super().__init__(f"{endpoint} did not finish within {timeout}s")
+        self.endpoint = endpoint
+        self.timeout = timeout
+
+
+class DownstreamUnavailableError(Exception):
+    def __init__(self, service: str):
+        super().__init__(f"no healthy replica of {service}")
+        self.service = service
+
+
+def _env_seconds(name: str, default: Optional[float]) -> Optional[float]:
+    """读取秒数配置, 0 或空字符串表示不限制"""
+    value = os.getenv(name)
+    if value is None:
+        return default
+    seconds = float(value) if value.strip() else 0
+    return seconds if seconds > 0 else None
+
+
+class Replica:
+    """下游服务的一个副本, 有自己的连接池、进行中的请求数、健康状态和熔断器"""
+
+    def __init__(self, url: str, max_connections: int):
+        self.url = url
+        self.max_connections = max_connections
+        self.outstanding = 0
+        self.healthy = True
+        self.breaker = CircuitBreaker(DOWNSTREAM_BREAKER_FAILURES, DOWNSTREAM_BREAKER_COOLDOWN)
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.url,
+                limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections),
+            )
+        return self._client
+
+    def available(self) -> bool:
+        return self.healthy and self.breaker.available()
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class Endpoint:
+    """
+    下游服务的一个接口, 读超时和总时限可以用 <SERVICE>_<ENDPOINT>_READ_TIMEOUT / <SERVICE>_<ENDPOINT>_TIMEOUT 覆盖
+    """
+
+    def __init__(
+        self,
+        service: "Downstream",
+        name: str,
+        method: str,
+        path: str,
+        read_timeout: Optional[float],
+        total_timeout: Optional[float],
+    ):
+        self.service = service
+        self.name = f"{service.name}.{name}"
+        self.method = method
+        self.path = path
+        env = f"{service.name}_{name}".upper()
+        self.read_timeout = _env_seconds(f"{env}_READ_TIMEOUT", read_timeout)
+        self.total_timeout = _env_seconds(f"{env}_TIMEOUT", total_timeout)
+
+    def _timeout(self) -> httpx.Timeout:
+        connect = self.service.connect_timeout
+        return httpx.Timeout(connect=connect, read=self.read_timeout, write=self.read_timeout, pool=connect)
+
+    async def request(self, affinity: Optional[str] = None, replica: Optional[str] = None, **kwargs) -> httpx.Response:
+        """
+        选一个副本发送请求, 其它参数同 httpx.AsyncClient.request
+        affinity: 请求使用的模型, 优先发往上次处理过该模型的副本
+        replica: 指定副本的地址(例如已在该副本上分配了 GPU 槽位), 不再做负载均衡
+        超过总时限时抛出 DownstreamTimeoutError, 没有可用副本时抛出 DownstreamUnavailableError
+        """
+        _ensure_health_checks()
+        replica = self.service.pick(affinity, replica)
+        replica.outstanding += 1
+        try:
+            call = replica.client.request(self.method, self.path, timeout=self._timeout(), **kwargs)
+            if self.total_timeout is None:
+                response = await call
+            else:
+                try:
+                    response = await asyncio.wait_for(call, self.total_timeout)
+                except asyncio.TimeoutError:
+                    raise DownstreamTimeoutError(self.name, self.total_timeout) from None
+        except (httpx.TransportError, DownstreamTimeoutError):
+            replica.breaker.on_failure()
+            raise
+        except BaseException:
+            # 调用方取消等情况无法判断副本的状态, 不计入熔断
+            replica.breaker.release()
+            raise
+        finally:
+            replica.outstanding -= 1
+        if response.status_code >= 500:
+            replica.breaker.on_failure()
+        else:
+            replica.breaker.on_success()
+            if affinity:
+                self.service.remember(affinity, replica)
+        return response
+
+
+class Downstream:
+    """
+    A downstream inference service backed by one or more replicas.
+
+    Addresses come from <SERVICE>_URLS (comma separated) or <SERVICE>_URL,
+    falling back to `default_url`; every replica has its own pooled
+    keep-alive client. Requests go to the available replica with the fewest
+    outstanding requests in this process. A replica is unavailable while its
+    active health check (GET <SERVICE>_HEALTH_PATH, any non-5xx answer is
+    healthy) fails or its circuit breaker is open after consecutive
+    transport errors, timeouts or 5xx responses.
+
+    Requests that name a model (`affinity`) prefer the replica that last
+    served it, tracked cluster-wide in the redis hash
+    downstream_affinity:<service>, as long as that replica's load stays
+    within DOWNSTREAM_AFFINITY_LOAD_FACTOR times the average (bounded-load
+    fallback to the least loaded one), so GPU servers reload models less.
+
+    Requests carry file paths, so all replicas must see the same storage.
+    """
+
+    def __init__(self, name: str, default_url: str, max_connections: int = 20):
+        self.name = name
+        env = name.upper()
+        urls = os.getenv(f"{env}_URLS") or os.getenv(f"{env}_URL", default_url)
+        self.replicas = [Replica(url.strip(), max_connections) for url in urls.split(",") if url.strip()]
+        self.connect_timeout = _env_seconds(f"{env}_CONNECT_TIMEOUT", DEFAULT_CONNECT_TIMEOUT)
+        self.health_path = os.getenv(f"{env}_HEALTH_PATH", "/")
+        self.affinity_key = f"downstream_affinity:{name}"
+
+    def endpoint(
+        self,
+        name: str,
+        path: str,
+        method: str = "POST",
+        read_timeout: Optional[float] = None,
+        total_timeout: Optional[float] = None,
+    ) -> Endpoint:
+        """
+        声明一个接口
+        read_timeout: 等待响应数据的超时, None 表示不限制
+        total_timeout: 整个请求的时限, None 表示不限制
+        """
+        return Endpoint(self, name, method, path, read_timeout, total_timeout)
+
+    def available_urls(self) -> List[str]:
+        return [replica.url for replica in self.replicas if replica.available()]
+
+    def pick(self, affinity: Optional[str] = None, url: Optional[str] = None) -> Replica:
+        """
+        选出一个可用副本: 优先处理过 affinity 的副本(负载有上限), 否则选进行中请求最少的, 相同时随机选择
+        url: 直接使用该地址的副本
+        """
+        if url is not None:
+            replica = next((replica for replica in self.replicas if replica.url == url), None)
+            if replica is None:
+                raise DownstreamUnavailableError(self.name)
+            replica.breaker.acquire()
+            return replica
+        candidates = [replica for replica in self.replicas if replica.available()]
+        if not candidates:
+            raise DownstreamUnavailableError(self.name)
+        replica = self._preferred(candidates, affinity) if affinity and len(candidates) > 1 else None
+        if replica is None:
+            least = min(replica.outstanding for replica in candidates)
+            replica = random.choice([replica for replica in candidates if replica.outstanding == least])
+        replica.breaker.acquire()
+        return replica
+
+    def affinity_of(self, affinity: Optional[str]) -> Optional[str]:
+        """上次处理 affinity 的副本地址"""
+        if not affinity or len(self.replicas) == 1:
+            return None
+        try:
+            url = r.hget(self.affinity_key, affinity)
+        except RedisError as e:
+            logger.warning("read affinity of %s failed: %s", self.name, e)
+            return None
+        return url.decode() if url is not None else None
+
+    def _preferred(self, candidates: List[Replica], affinity: str) -> Optional[Replica]:
+        url = self.affinity_of(affinity)
+        replica = next((replica for replica in candidates if replica.url == url), None)
+        if replica is None:
+            return None
+        total = sum(candidate.outstanding for candidate in candidates) + 1
+        if replica.outstanding + 1 > math.ceil(DOWNSTREAM_AFFINITY_LOAD_FACTOR * total / len(candidates)):
+            logger.debug("replica %s of %s is too busy for %s", replica.url, self.name, affinity)
+            return None
+        return replica
+
+    def remember(self, affinity: str, replica: Replica):
+        """记录 affinity 最近由 replica 处理"""
+        if len(self.replicas) == 1:
+            return
+        try:
+            r.hset(self.affinity_key, affinity, replica.url)
+        except RedisError as e:
+            logger.warning("save affinity of %s failed: %s", self.name, e)
+
+    async def _check_replica(self, replica: Replica):
+        try:
+            response = await replica.client.get(self.health_path, timeout=DOWNSTREAM_HEALTH_TIMEOUT)
+            healthy = response.status_code < 500
+        except httpx.HTTPError:
+            healthy = False
+        if healthy != replica.healthy:
+            logger.warning("downstream %s replica %s healthy: %s", self.name, replica.url, healthy)
+        replica.healthy = healthy
+
+    async def check_health(self):
+        await asyncio.gather(*(self._check_replica(replica) for replica in self.replicas))
+
+    async def aclose(self):
+        for replica in self.replicas:
+            await replica.aclose()
+
+
+_downstreams: Dict[str, Downstream] = {}
+_health_checker: Optional[asyncio.Task] = None
+
+
+def downstream(name: str, default_url: str, max_connections: int = 20) -> Downstream:
+    """返回名为 name 的下游服务, 同名服务只创建一次, 共用连接池"""
+    if name not in _downstreams:
+        _downstreams[name] = Downstream(name, default_url, max_connections)
+    return _downstreams[name]
+
+
+def downstreams() -> List[Downstream]:
+    return list(_downstreams.values())
+
+
+async def _check_health_forever():
+    while True:
+        await asyncio.gather(*(service.check_health() for service in downstreams()), return_exceptions=True)
+        await asyncio.sleep(DOWNSTREAM_HEALTH_INTERVAL)
+
+
+def _ensure_health_checks():
+    """第一次请求时在当前事件循环里启动主动健康检查"""
+    global _health_checker
+    if DOWNSTREAM_HEALTH_INTERVAL > 0 and (_health_checker is None or _health_checker.done()):
+        _health_checker = asyncio.create_task(_check_health_forever())
+
+
+def _collect_downstream_metrics():
+    replicas = [(service, replica) for service in downstreams() for replica in service.replicas]
+    return [
+        *gauge_lines(
+            "mercury_downstream_outstanding",
+            "Requests in flight per downstream replica in this process",
+            [({"service": s.name, "replica": r.url}, r.outstanding) for s, r in replicas],
+        ),
+        *gauge_lines(
+            "mercury_downstream_available",
+            "Whether a downstream replica is healthy and its circuit breaker lets requests through",
+            [({"service": s.name, "replica": r.url}, int(r.available())) for s, r in replicas],
+        ),
+    ]
+
+
+register_collector(_collect_downstream_metrics)
+
+
+async def close_downstreams():
+    """停止健康检查并关闭所有下游服务的连接池, 在 lifespan / worker 退出时调用"""
+    global _health_checker
+    if _health_checker is not None:
+        _health_checker.cancel()
+        await asyncio.gather(_health_checker, return_exceptions=True)
+        _health_checker = None
+    for service in downstreams():
+        try:
+            await service.aclose()
+        except Exception as e:
+            logger.warning("close downstream %s failed: %s", service.name, e)
+
+
+# 下游推理服务, 地址用 <SERVICE>_URLS 配置, 例如 RVC_URLS=http://10.0.0.2:3334,http://10.0.0.3:3334
+rvc_service = downstream("rvc", "http://127.0.0.1:3334")
+cosy_service = downstream("cosy", "http://127.0.0.1:3335")
+# 字幕生成和音频切分
+audio_service = downstream("audio", "http://127.0.0.1:3336")
+gpt_service = downstream("gpt", "http://127.0.0.1:9880")
+talking_head_service = downstream("talking_head", "http://0.0.0.0:8000")
@@ -0,0 +1,138 @@
+import asyncio
+import json
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Dict, Optional, Set
+
+from redis.exceptions import RedisError
+
+from infra.logger import logger
+from infra.r import ar
+
+TASK_EVENTS_PREFIX = "task_events:"
+
+# 重新订阅后发给所有订阅者, 断线期间可能漏掉了事件, 订阅者应重新读取任务状态
+RESYNC_EVENT = {"event": "resync"}
+
+# 单个订阅者最多缓存的事件数, 消费太慢时丢弃新事件
+_SUBSCRIBER_MAX_EVENTS = 100
+
+
+def task_channel(task_id: int) -> str:
+    return f"{TASK_EVENTS_PREFIX}{task_id}"
+
+
+async def publish_task_event(task_id: int, event: str, **data):
+    """
+    发布任务事件到 task_events:<task_id>, 发布失败只记录日志, 不影响调用方
+    """
+    message = json.dumps({"task_id": task_id, "event": event, **data}, default=str)
+    try:
+        await ar.publish(task_channel(task_id), message)
+    except RedisError as e:
+        logger.warning("publish event of task %s failed: %s", task_id, e)
+
+
+async def wait_for_event(
+    events: asyncio.Queue, predicate: Callable[[dict], bool], timeout: float
+) -> Optional[dict]:
+    """
+    从 TaskEventHub.subscribe 返回的队列中等待满足 predicate 的事件, 超时返回 None
+    RESYNC_EVENT 总是返回, 调用方应重新读取任务状态
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while True:
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            return None
+        try:
+            event = await asyncio.wait_for(events.get(), remaining)
+        except asyncio.TimeoutError:
+            return None
+        if event is RESYNC_EVENT or predicate(event):
+            return event
+
+
+class TaskEventHub:
+    """
+    Per-process fan-out of task events.
+
+    One pattern subscription on task_events:* delivers every event to the
+    local subscribers of that task, so open event streams cost no extra Redis
+    connections. The listener starts with the first subscriber and
+    re-subscribes after connection errors, sending RESYNC_EVENT to everyone.
+    """
+
+    def __init__(self):
+        self._subscribers: Dict[int, Set[asyncio.Queue]] = defaultdict(set)
+        self._listener: Optional[asyncio.Task] = None
+        self._ready: Optional[asyncio.Event] = None
+
+    def _ensure_started(self):
+        if self._listener is None or self._listener.done():
+            self._ready = asyncio.Event()
+            self._listener = asyncio.create_task(self._listen())
+
+    def _dispatch(self, task_id: int, event: dict):
+        for queue in self._subscribers.get(task_id, ()):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                logger.warning("drop event of task %s, subscriber is too slow", task_id)
+
+    async def _listen(self):
+        resubscribed = False
+        while True:
+            pubsub = ar.pubsub()
+            try:
+                await pubsub.psubscribe(f"{TASK_EVENTS_PREFIX}*")
+                async for message in pubsub.listen():
+                    if message["type"] == "psubscribe":
+                        self._ready.set()
+                        if resubscribed:
+                            for task_id in list(self._subscribers):
+                                self._dispatch(task_id, RESYNC_EVENT)
+                        continue
+                    if message["type"] != "pmessage":
+                        continue
+                    event = json.loads(message["data"])
+                    self._dispatch(int(event["task_id"]), event)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("task event listener error: %s", e)
+                self._ready.clear()
+                resubscribed = True
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.close()
+
+    @asynccontextmanager
+    async def subscribe(self, task_id: int, timeout: float = 5) -> AsyncIterator[asyncio.Queue]:
+        """
+        订阅一个任务的事件, 返回的队列中依次是事件 dict
+        进入时等待订阅生效(最多 timeout 秒), 之后再读取任务状态就不会漏掉事件
+        """
+        queue = asyncio.Queue(maxsize=_SUBSCRIBER_MAX_EVENTS)
+        self._subscribers[task_id].add(queue)
+        try:
+            self._ensure_started()
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning("task event subscription is not ready, events of task %s may be delayed", task_id)
+            yield queue
+        finally:
+            self._subscribers[task_id].discard(queue)
+            if not self._subscribers[task_id]:
+                del self._subscribers[task_id]
+
+    async def stop(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+            self._listener = None
+
+
+task_event_hub = TaskEventHub()
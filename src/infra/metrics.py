@@ -0,0 +1,103 @@
+import functools
+import time
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+from infra.r import r
+
+# 秒, 覆盖从短 TTS 到长时间的视频推理
+DEFAULT_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+_histograms: List["Histogram"] = []
+_collectors: List[Callable[[], Iterable[str]]] = []
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    def escape(value) -> str:
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+    return ",".join(f'{name}="{escape(value)}"' for name, value in sorted(labels.items()))
+
+
+def gauge_lines(name: str, documentation: str, samples: Iterable[Tuple[Dict[str, str], float]]) -> List[str]:
+    """Renders a gauge family in Prometheus text format."""
+    lines = [f"# HELP {name} {documentation}", f"# TYPE {name} gauge"]
+    for labels, value in samples:
+        lines.append(f"{name}{{{_format_labels(labels)}}} {value}")
+    return lines
+
+
+class Histogram:
+    """
+    Prometheus histogram whose buckets are kept in a redis hash, so API and
+    worker processes add to the same series and any process can serve them.
+    """
+
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = sorted(buckets)
+        self.key = f"metrics:{name}"
+        _histograms.append(self)
+
+    def observe(self, value: float, **labels):
+        label_str = _format_labels(labels)
+        pipe = r.pipeline(transaction=False)
+        for bucket in self.buckets:
+            if value <= bucket:
+                pipe.hincrby(self.key, f"{label_str}|{bucket}", 1)
+        pipe.hincrby(self.key, f"{label_str}|+Inf", 1)
+        pipe.hincrbyfloat(self.key, f"{label_str}|sum", value)
+        pipe.execute()
+
+    def collect(self) -> List[str]:
+        series = defaultdict(dict)
+        for field, value in r.hgetall(self.key).items():
+            label_str, suffix = field.decode().rsplit("|", 1)
+            series[label_str][suffix] = float(value)
+
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for label_str, values in sorted(series.items()):
+            prefix = f"{label_str}," if label_str else ""
+            for bucket in [*(str(b) for b in self.buckets), "+Inf"]:
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bucket}"}} {int(values.get(bucket, 0))}')
+            lines.append(f"{self.name}_sum{{{label_str}}} {values.get('sum', 0)}")
+            lines.append(f"{self.name}_count{{{label_str}}} {int(values.get('+Inf', 0))}")
+        return lines
+
+
+def register_collector(collector: Callable[[], Iterable[str]]):
+    """Registers a callback that renders extra metric lines (e.g. gauges read at scrape time)."""
+    _collectors.append(collector)
+
+
+def render_metrics() -> str:
+    lines = []
+    for collector in _collectors:
+        lines.extend(collector())
+    for histogram in _histograms:
+        lines.extend(histogram.collect())
+    return "\n".join(lines) + "\n"
+
+
+downstream_seconds = Histogram("mercury_downstream_seconds", "Latency of calls to downstream inference stages")
+
+
+def timed_stage(stage: str):
+    """Records the latency of an async downstream call in mercury_downstream_seconds."""
+
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.monotonic()
+            status = "error"
+            try:
+                result = await func(*args, **kwargs)
+                status = "ok"
+                return result
+            finally:
+                downstream_seconds.observe(time.monotonic() - started, stage=stage, status=status)
+
+        return wrapper
+
+    return decorator
@@ -1,13 +1,18 @@
 from redis import Redis
+from redis.asyncio import Redis as AsyncRedis
 from urllib.parse import urlparse
 from config import REDIS_URL
 
 parsed_url = urlparse(REDIS_URL)
 
-
-r = Redis(
+redis_kwargs = dict(
     host=parsed_url.hostname or "0.0.0.0",
     port=int(parsed_url.port or 6345),
     password=parsed_url.password or "mercury",
     db=0,
 )
+
+r = Redis(**redis_kwargs)
+
+# 用于阻塞命令(BLPOP 等)和 pub/sub, 不占用事件循环
+ar = AsyncRedis(**redis_kwargs)
@@ -1,7 +1,13 @@
+import asyncio
 from contextlib import asynccontextmanager
 import os
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from common.task_queue import QueueFullError, start_consumers
+from infra.config import TASK_CONSUMER_QUEUES
 from infra.db import database, metadata, engine
+from infra.downstream import close_downstreams
+from infra.events import task_event_hub
 from middleware.auth import AuthMiddleware
 from middleware.exception import ExceptionMiddleware
 from routes.task import router as taskRouter
@@ -12,8 +18,10 @@ from routes.internal import router as internalRouter
 from routes.model import router as modelRouter
 from routes.train import router as trainRouter
 
-from task.infer_http import infer_text2audio_queue, infer_audio2video_queue, infer_text2video_queue
-from task.train_http import train_audio_queue, train_video_queue
+# 导入即注册任务队列
+import task.infer_http  # noqa: F401
+import task.train_http  # noqa: F401
+from task.azure_speech import azure_synthesizers, warm_up_azure_voices
 
 current_path = os.path.abspath(__file__)
 project_root = os.path.dirname(current_path)
@@ -23,19 +31,32 @@ os.environ['PROJECT_ROOT'] = project_root
 async def lifespan(app: FastAPI):
     await database.connect()  # establish connection
     metadata.create_all(engine)  # init tables
-    
-    infer_text2audio_queue.schedule_task_processing()
-    infer_audio2video_queue.schedule_task_processing()
-    infer_text2video_queue.schedule_task_processing()
-    train_audio_queue.schedule_task_processing()
-    train_video_queue.schedule_task_processing()
-    
+
+    queues = start_consumers(TASK_CONSUMER_QUEUES)
+    # 后台为常用音色建立 Azure 连接, 不影响启动
+    warm_up = asyncio.create_task(warm_up_azure_voices())
+
     yield
+    warm_up.cancel()
+    await asyncio.gather(*(queue.stop() for queue in queues))
+    await task_event_hub.stop()
+    await close_downstreams()
+    azure_synthesizers.shutdown()
     await database.disconnect()
 
 
 app = FastAPI(lifespan=lifespan)
 
+
+@app.exception_handler(QueueFullError)
+async def queue_full_handler(request: Request, exc: QueueFullError):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
 app.add_middleware(AuthMiddleware)
 app.add_middleware(ExceptionMiddleware)
 
@@ -1,10 +1,15 @@
 import datetime
 from enum import Enum
-from typing import Any, Optional
+from typing import Any, Callable, Dict, Optional
 
 import ormar
 
 from infra.db import BaseModel, base_ormar_config
+from infra.events import publish_task_event
+from infra.r import ar
+
+# 任务锁的最长持有时间(秒), 持锁期间只做一次读写
+_TASK_LOCK_TIMEOUT = 10
 
 
 class TaskStatus(int, Enum):
@@ -14,6 +19,10 @@ class TaskStatus(int, Enum):
     FAILED = 3
 
 
+# 结束状态, 不会再被改回 PENDING
+FINISHED_STATUSES = (TaskStatus.SUCCEEDED, TaskStatus.FAILED)
+
+
 class Task(BaseModel):
     ormar_config = base_ormar_config.copy(tablename="task")
 
@@ -39,5 +48,21 @@ async def create_task():
 
 
 async def update_task(task_id: int, **kwargs: Any):
-    t = await Task.objects.get(id=task_id)
-    return await t.update(**kwargs)
+    return await modify_task(task_id, lambda t: kwargs)
+
+
+async def modify_task(task_id: int, modify: Callable[[Task], Optional[Dict[str, Any]]]):
+    """
+    在任务锁内读取最新的行, 更新 modify 返回的字段, modify 返回空表示不需要更新
+    下游回调(API 进程)和流水线/队列(worker 进程)会同时修改同一个任务, 都经过这里才不会互相覆盖
+    """
+    lock = ar.lock(f"task_lock:{task_id}", timeout=_TASK_LOCK_TIMEOUT, blocking_timeout=_TASK_LOCK_TIMEOUT)
+    async with lock:
+        t = await Task.objects.get(id=task_id)
+        kwargs = modify(t)
+        if not kwargs:
+            return t
+        t = await t.update(**kwargs)
+    # 通知 /tasks/{task_id}/events 等订阅者
+    await publish_task_event(task_id, "update", status=t.status, res=t.res)
+    return t
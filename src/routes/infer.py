@@ -1,3 +1,4 @@
+import asyncio
 import os
 import uuid
 from typing import Optional
@@ -5,8 +6,10 @@ from typing import Optional
 from fastapi import APIRouter, Request, HTTPException
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel, Field
-from starlette.responses import FileResponse
+from starlette.background import BackgroundTask
+from starlette.responses import FileResponse, StreamingResponse
 
+from infra.config import AZURE_UPLOAD_OUTPUT
 from infra.logger import logger
 from middleware.auth import getUserInfo
 from models.file import create_cos_file, query_file, File
@@ -23,9 +26,15 @@ from task.infer_http import (
     InferText2VideoPayload,
     InferAudio2VideoPayload,
     azure_tts,
+    close_stream,
     rvc_infer,
-    srt_infer,
+    segmented_srt_infer,
+    stream_audio,
+    stream_limiter,
+    text_cache_key,
+    text_priority,
 )
+from task.infer_cache import infer_cache
 from utils.file import createDir
 
 router = APIRouter(
@@ -115,13 +124,8 @@ async def infer_video(
         rst = publish_talking_head_infer_task(str(audio_file.id), model.video_model, output_video_key)
         return JSONResponse({"task_id": rst.id})
 
-    task = await infer_audio2video_queue.append(
-        InferAudio2VideoPayload(
-            model_name=model_name,
-            audio_id=file_id,
-            user_id=user_id,
-        ).to_json()
-    )
+    infer_audio2video_queue.check_capacity()
+    task = await create_task()
 
     output_dir_path = gen_output_dir(model.name, user_id, task.id)
     output_video_name = f"{task.id}.mp4"
@@ -134,6 +138,15 @@ async def infer_video(
             "output_video_file_id": video_file.id,
         },
     )
+    await infer_audio2video_queue.append(
+        InferAudio2VideoPayload(
+            model_name=model_name,
+            audio_id=file_id,
+            user_id=user_id,
+        ).to_json(),
+        user_id=user_id,
+        task=task,
+    )
 
     return JSONResponse(
         {
@@ -180,7 +193,8 @@ async def infer_text2video(body: Text2VideoRequest, req: Request):
         if body.mode == AudioModeType.RVC:
             azure_output_audio_name = f"{uid}.azure.wav"
             azure_output_audio_cos = f"infer/{azure_output_audio_name}"
-            outputs.append(File(name=azure_output_audio_name, key=azure_output_audio_cos, user_id=user_id))
+            if AZURE_UPLOAD_OUTPUT:
+                outputs.append(File(name=azure_output_audio_name, key=azure_output_audio_cos, user_id=user_id))
         else:
             azure_output_audio_cos = None
         if body.gen_srt:
@@ -204,16 +218,8 @@ async def infer_text2video(body: Text2VideoRequest, req: Request):
         )
         return JSONResponse({"task_id": rst.id})
 
-    task = await infer_text2video_queue.append(
-        InferText2VideoPayload(
-            text=body.text,
-            model_name=body.model_name,
-            audio_profile=body.audio_profile,
-            mode=body.mode,
-            gen_srt=body.gen_srt,
-            user_id=user_id,
-        ).to_json()
-    )
+    infer_text2video_queue.check_capacity()
+    task = await create_task()
     task_id = task.id
     output_dir_path = gen_output_dir(model.name, user_id, task_id)
     output_video_name = f"{task_id}.mp4"
@@ -237,6 +243,19 @@ async def infer_text2video(body: Text2VideoRequest, req: Request):
             "output_srt_file_id": srt_file_id,
         },
     )
+    await infer_text2video_queue.append(
+        InferText2VideoPayload(
+            text=body.text,
+            model_name=body.model_name,
+            audio_profile=body.audio_profile,
+            mode=body.mode,
+            gen_srt=body.gen_srt,
+            user_id=user_id,
+        ).to_json(),
+        user_id=user_id,
+        priority=text_priority(body.text),
+        task=task,
+    )
 
     return JSONResponse(
         {
@@ -283,7 +302,8 @@ async def infer_text2audio(body: Text2AudioRequest, req: Request):
         if body.mode == AudioModeType.RVC:
             azure_output_audio_name = f"{uid}.azure.wav"
             azure_output_audio_cos = f"infer/{azure_output_audio_name}"
-            outputs.append(File(name=azure_output_audio_name, key=azure_output_audio_cos, user_id=user_id))
+            if AZURE_UPLOAD_OUTPUT:
+                outputs.append(File(name=azure_output_audio_name, key=azure_output_audio_cos, user_id=user_id))
         else:
             azure_output_audio_cos = None
         if body.gen_srt:
@@ -305,7 +325,43 @@ async def infer_text2audio(body: Text2AudioRequest, req: Request):
         )
         return JSONResponse({"task_id": rst.id})
 
-    task = await infer_text2audio_queue.append(
+    # 相同输入已经合成过时直接复用结果, 不进入队列; 先复制到临时文件, 复制失败时按未命中检查队列容量, 再创建记录
+    cache_key = text_cache_key(body.text, model, body.audio_profile, body.mode)
+    kinds = ["audio", "srt"] if body.gen_srt else ["audio"]
+    cached = await asyncio.to_thread(infer_cache.checkout, cache_key, kinds)
+    if cached is None:
+        infer_text2audio_queue.check_capacity()
+    try:
+        task = await create_task()
+
+        task_id = task.id
+        output_dir_path = gen_output_dir(body.model_name, user["user_id"], task_id)
+        output_audio_name = f"{task_id}.wav"
+        output_audio_path = os.path.join(output_dir_path, output_audio_name)
+        audio_file = await create_cos_file(output_audio_name, output_audio_path, user["user_id"])
+        outputs = {"audio": output_audio_path}
+        srt_file_id = 0
+        if body.gen_srt:
+            output_srt_name = f"{task_id}.srt"
+            output_srt_path = os.path.join(output_dir_path, output_srt_name)
+            srt_file = await create_cos_file(output_srt_name, output_srt_path, user["user_id"])
+            srt_file_id = srt_file.id
+            outputs["srt"] = output_srt_path
+
+        res = {
+            "output_audio_file_id": audio_file.id,
+            "output_srt_file_id": srt_file_id,
+        }
+        if cached is not None:
+            await asyncio.to_thread(infer_cache.place, cached, outputs)
+            await update_task(task_id, status=TaskStatus.SUCCEEDED, res=res)
+            return JSONResponse({"task_id": task.id})
+    finally:
+        if cached is not None:
+            infer_cache.discard(cached)
+
+    await update_task(task_id, res=res)
+    await infer_text2audio_queue.append(
         InferText2AudioPayload(
             text=body.text,
             model_name=body.model_name,
@@ -313,27 +369,10 @@ async def infer_text2audio(body: Text2AudioRequest, req: Request):
             mode=body.mode,
             gen_srt=body.gen_srt,
             user_id=user["user_id"],
-        ).to_json()
-    )
-
-    task_id = task.id
-    output_dir_path = gen_output_dir(body.model_name, user["user_id"], task_id)
-    output_audio_name = f"{task_id}.wav"
-    output_audio_path = os.path.join(output_dir_path, output_audio_name)
-    audio_file = await create_cos_file(output_audio_name, output_audio_path, user["user_id"])
-    srt_file_id = 0
-    if body.gen_srt:
-        output_srt_name = f"{task_id}.srt"
-        output_srt_path = os.path.join(output_dir_path, output_srt_name)
-        srt_file = await create_cos_file(output_srt_name, output_srt_path, user["user_id"])
-        srt_file_id = srt_file.id
-
-    await update_task(
-        task_id,
-        res={
-            "output_audio_file_id": audio_file.id,
-            "output_srt_file_id": srt_file_id,
-        },
+        ).to_json(),
+        user_id=user["user_id"],
+        priority=text_priority(body.text),
+        task=task,
     )
 
     return JSONResponse(
@@ -343,6 +382,50 @@ async def infer_text2audio(body: Text2AudioRequest, req: Request):
     )
 
 
+class Text2AudioStreamRequest(BaseModel):
+    class Config(CommonSchemaConfig):
+        pass
+
+    text: str
+    model_name: str
+    audio_profile: str = "zh-CN-YunxiNeural (Male)"
+    mode: AudioModeType = AudioModeType.RVC  # 1 for azure, 2 for gpt
+
+
+@router.post("/text2audio/stream", response_class=StreamingResponse)
+async def infer_text2audio_stream(body: Text2AudioStreamRequest, req: Request):
+    """
+    边合成边返回 WAV 音频流(audio/wav, 长度未知), 每合成完一句就输出一句, 适合交互式场景
+    """
+    user = getUserInfo(req)
+    logger.debug("user: %s", user)
+
+    if celery_enabled:
+        raise HTTPException(status_code=501, detail="streaming is not supported when celery is enabled")
+
+    models = await query_model(name=body.model_name)
+    if len(models) == 0:
+        raise HTTPException(status_code=404, detail=f"model {body.model_name} not found")
+    model = models[0]
+
+    # 与排队的合成任务共用下游服务, 队列已满时同样拒绝
+    infer_text2audio_queue.check_capacity()
+
+    release = stream_limiter.acquire()
+    work_dir = os.path.join("/data", "prod", str(user["user_id"]), model.name, "stream", uuid.uuid4().hex)
+    try:
+        createDir(work_dir)
+    except Exception:
+        release()
+        raise
+    return StreamingResponse(
+        stream_audio(body.text, model, body.audio_profile, body.mode, work_dir, release),
+        media_type="audio/wav",
+        # 客户端在开始读取前断开时生成器不会执行, 由后台任务兜底清理
+        background=BackgroundTask(close_stream, work_dir, release),
+    )
+
+
 class AudioAsrRequest(BaseModel):
     class Config(CommonSchemaConfig):
         pass
@@ -387,7 +470,7 @@ async def infer_asr(body: AudioAsrRequest, req: Request):
         },
     )
 
-    await srt_infer(audio_path, output_srt_path, body.text)
+    await segmented_srt_infer(audio_path, output_srt_path, body.text)
 
     return JSONResponse(
         {
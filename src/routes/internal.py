@@ -1,8 +1,12 @@
 from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel
 
 import models.task as taskModel
 from infra.logger import logger
+from infra.metrics import render_metrics
+from task.pipeline import finish_submitted_stages, stages_failed
+from task.talking_head import talking_head_slots
 
 router = APIRouter(
     prefix="/internal",
@@ -27,4 +31,29 @@ async def get_tasks(task_id: int, task: Body):
     }
     if m[task.status] is None:
         return {"error": f"Unknown status: {task.status}"}
-    return await taskModel.update_task(task_id, status=m[task.status])
+    status = m[task.status]
+    finished = status in taskModel.FINISHED_STATUSES
+    if finished:
+        # 下游任务结束, 释放占用的 GPU 槽位, 等待中的任务会立即被唤醒
+        if talking_head_slots.release(task_id):
+            logger.debug(f"task_id: {task_id} released talking-head slot")
+
+    def modify(t: taskModel.Task):
+        # 已经失败的任务(如流水线中其它阶段失败)不再被回调改写
+        if t.status == taskModel.TaskStatus.FAILED:
+            return None
+        if not finished:
+            return {"status": status}
+        res = t.res or {}
+        changed = finish_submitted_stages(res, status == taskModel.TaskStatus.SUCCEEDED)
+        final = status
+        if final == taskModel.TaskStatus.SUCCEEDED and stages_failed(res):
+            final = taskModel.TaskStatus.FAILED
+        return {"status": final, "res": res} if changed else {"status": final}
+
+    return await taskModel.modify_task(task_id, modify)
+
+
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
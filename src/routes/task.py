@@ -1,18 +1,94 @@
+import asyncio
+import json
 from typing import List, Optional
 
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException, Query, Request
+from starlette.responses import StreamingResponse
 
 import models.task as taskModel
+from infra.events import task_event_hub, wait_for_event
 
 router = APIRouter(
     prefix="/tasks",
 )
 
+# 没有事件时发送注释行的间隔, 防止代理断开空闲连接
+SSE_KEEPALIVE_SECONDS = 15
+
+# 长轮询最长的等待时间
+LONG_POLL_MAX_SECONDS = 60
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def _status_event(task: taskModel.Task) -> dict:
+    return {"task_id": task.id, "event": "status", "status": task.status, "res": task.res}
+
 
 @router.get("", response_model=List[taskModel.Task])
-async def get_tasks(task_id: Optional[int] = None):
-    res = await taskModel.query_task(task_id)
-    return res
+async def get_tasks(
+    task_id: Optional[int] = None,
+    wait: float = Query(
+        0,
+        ge=0,
+        le=LONG_POLL_MAX_SECONDS,
+        description="长轮询: 指定 task_id 时最多等待 wait 秒, 任务状态变化或结束后立即返回",
+    ),
+):
+    if task_id is None or wait <= 0:
+        return await taskModel.query_task(task_id)
+
+    async with task_event_hub.subscribe(task_id) as events:
+        # 订阅生效后再读取状态, 之后的变化都会收到
+        res = await taskModel.query_task(task_id)
+        if not res or res[0].status in taskModel.FINISHED_STATUSES:
+            return res
+        status = res[0].status
+        event = await wait_for_event(events, lambda e: e["event"] == "update" and e["status"] != status, wait)
+    if event is None:
+        return res
+    return await taskModel.query_task(task_id)
+
+
+@router.get("/{task_id}/events", response_class=StreamingResponse)
+async def get_task_events(task_id: int, req: Request):
+    """
+    用 Server-Sent Events 推送任务进度, 任务成功或失败后关闭连接
+    event: status 连接后的当前状态; update 状态或 res 变化; queued / started / retry 队列事件
+    """
+    if not await taskModel.query_task(task_id):
+        raise HTTPException(status_code=404, detail=f"task {task_id} not found")
+
+    async def stream():
+        async with task_event_hub.subscribe(task_id) as events:
+            # 订阅生效后再读取状态, 之后的变化都会收到
+            event = None
+            while True:
+                if event is None or event["event"] == "resync":
+                    tasks = await taskModel.query_task(task_id)
+                    if not tasks:
+                        return
+                    event = _status_event(tasks[0])
+                yield _sse(event["event"], event)
+                if event.get("status") in taskModel.FINISHED_STATUSES:
+                    return
+
+                event = None
+                while event is None:
+                    try:
+                        event = await asyncio.wait_for(events.get(), SSE_KEEPALIVE_SECONDS)
+                    except asyncio.TimeoutError:
+                        if await req.is_disconnected():
+                            return
+                        yield ": keepalive\n\n"
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @router.post("", response_model=taskModel.Task)
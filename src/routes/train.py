@@ -6,6 +6,7 @@ from fastapi import APIRouter, Request
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 
+from common.task_queue import TaskPriority
 from middleware.auth import getUserInfo
 from models.file import query_file
 from models.model import create_model, query_model, update_model
@@ -36,6 +37,8 @@ async def train_audio_model(
     body: TrainAudioRequestBody,
 ):
     user = getUserInfo(req)
+    if not celery_enabled:
+        train_audio_queue.check_capacity()
 
     models = await query_model(name=body.model_name)
     if len(models) == 0:
@@ -64,7 +67,11 @@ async def train_audio_model(
         new_file_path = os.path.join(ref_dir_name, file_name)
         shutil.copy(file.path, new_file_path)
 
-    task = await train_audio_queue.append(TrainAudioTask(body.model_name, ref_dir_name, body.epoch).to_json())
+    task = await train_audio_queue.append(
+        TrainAudioTask(body.model_name, ref_dir_name, body.epoch).to_json(),
+        user_id=user["user_id"],
+        priority=TaskPriority.LOW,
+    )
 
     return JSONResponse({"task_id": task.id})
 
@@ -84,6 +91,8 @@ async def train_video_model(
     body: TrainVideoRequestBody,
 ):
     user = getUserInfo(req)
+    if not celery_enabled:
+        train_video_queue.check_capacity()
 
     models = await query_model(name=body.model_name)
     if len(models) == 0:
@@ -115,6 +124,10 @@ async def train_video_model(
         shutil.copy(file.path, new_file_path)
         count = count + 1
 
-    task = await train_video_queue.append(TrainVideoTask(body.speaker).to_json())
+    task = await train_video_queue.append(
+        TrainVideoTask(body.speaker).to_json(),
+        user_id=user["user_id"],
+        priority=TaskPriority.LOW,
+    )
 
     return JSONResponse({"task_id": task.id})
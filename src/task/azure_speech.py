@@ -0,0 +1,125 @@
+import asyncio
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Tuple
+
+import azure.cognitiveservices.speech as speechsdk
+
+from infra.config import (
+    AZURE_SPEECH_KEY,
+    AZURE_SPEECH_REGION,
+    AZURE_TTS_POOL_SIZE,
+    AZURE_TTS_THREADS,
+    AZURE_TTS_WARM_VOICES,
+)
+from infra.logger import logger
+from utils.srt import Cue
+
+
+def voice_name(audio_profile: str) -> str:
+    # remove all (xxx), example: "zh-CN-XiaoxiaoNeural (Female)" to be "zh-CN-XiaoxiaoNeural"
+    return audio_profile.split(" (")[0]
+
+
+class _PooledSynthesizer:
+    """synthesizer 和它本次合成收到的字词边界(相对本段音频的时间)"""
+
+    def __init__(self, synthesizer: speechsdk.SpeechSynthesizer):
+        self.synthesizer = synthesizer
+        self.words: List[Cue] = []
+        synthesizer.synthesis_word_boundary.connect(self._on_word_boundary)
+
+    def _on_word_boundary(self, evt: speechsdk.SpeechSynthesisWordBoundaryEventArgs):
+        # audio_offset 的单位是 100 纳秒
+        start = evt.audio_offset / 10_000_000
+        self.words.append(Cue(start, start + evt.duration.total_seconds(), evt.text))
+
+    def speak(self, text: str) -> Tuple[speechsdk.SpeechSynthesisResult, List[Cue]]:
+        self.words = []
+        result = self.synthesizer.speak_text_async(text).get()
+        return result, self.words
+
+
+class AzureSynthesizerPool:
+    """
+    Azure speech synthesis that never blocks the event loop.
+
+    The SDK calls run on a dedicated thread pool. Synthesizers are created
+    with audio_config=None (the audio comes back in the result instead of a
+    file), opened eagerly and kept per voice for reuse, so the websocket
+    setup to Azure is paid once rather than per request. A synthesizer whose
+    request was cancelled is dropped instead of being reused. Word boundary
+    events are collected during synthesis so subtitles can be written
+    without an ASR pass.
+    """
+
+    def __init__(self, key: str, region: str, threads: int = 8, pool_size: int = 4):
+        self.key = key
+        self.region = region
+        self.pool_size = pool_size
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="azure-tts")
+        self._idle: Dict[str, List[_PooledSynthesizer]] = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def _create(self, voice: str) -> _PooledSynthesizer:
+        speech_config = speechsdk.SpeechConfig(subscription=self.key, region=self.region)
+        speech_config.speech_synthesis_voice_name = voice
+        synthesizer = speechsdk.SpeechSynthesizer(speech_config=speech_config, audio_config=None)
+        # 提前建立连接, 第一次合成时不用再等待
+        speechsdk.Connection.from_speech_synthesizer(synthesizer).open(True)
+        return _PooledSynthesizer(synthesizer)
+
+    def _take(self, voice: str) -> _PooledSynthesizer:
+        with self._lock:
+            if self._idle[voice]:
+                return self._idle[voice].pop()
+        return self._create(voice)
+
+    def _give_back(self, voice: str, synthesizer: _PooledSynthesizer):
+        with self._lock:
+            if len(self._idle[voice]) < self.pool_size:
+                self._idle[voice].append(synthesizer)
+
+    def _speak(self, voice: str, text: str) -> Tuple[speechsdk.SpeechSynthesisResult, List[Cue]]:
+        synthesizer = self._take(voice)
+        result, words = synthesizer.speak(text)
+        if result.reason != speechsdk.ResultReason.Canceled:
+            self._give_back(voice, synthesizer)
+        return result, words
+
+    async def speak(self, voice: str, text: str) -> Tuple[speechsdk.SpeechSynthesisResult, List[Cue]]:
+        """在线程池里合成, 返回结果(audio_data 为 WAV 数据)和合成时收到的字词边界"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._speak, voice, text)
+
+    def _warm_up(self, voice: str):
+        with self._lock:
+            missing = self.pool_size - len(self._idle[voice])
+        for _ in range(missing):
+            self._give_back(voice, self._create(voice))
+
+    async def warm_up(self, voices: Iterable[str]):
+        """为常用的音色预先建立连接, 失败只记录日志"""
+        loop = asyncio.get_running_loop()
+        for voice in voices:
+            try:
+                await loop.run_in_executor(self._executor, self._warm_up, voice)
+            except Exception as e:
+                logger.warning("warm up azure voice %s failed: %s", voice, e)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+        with self._lock:
+            self._idle.clear()
+
+
+azure_synthesizers = AzureSynthesizerPool(
+    AZURE_SPEECH_KEY, AZURE_SPEECH_REGION, threads=AZURE_TTS_THREADS, pool_size=AZURE_TTS_POOL_SIZE
+)
+
+
+async def warm_up_azure_voices():
+    voices = [voice_name(voice.strip()) for voice in AZURE_TTS_WARM_VOICES.split(",") if voice.strip()]
+    if voices:
+        await azure_synthesizers.warm_up(voices)
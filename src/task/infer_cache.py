@@ -0,0 +1,172 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, Optional, Sequence
+
+from infra.config import INFER_CACHE_ENABLED, INFER_CACHE_MAX_ENTRIES, INFER_CACHE_TTL
+from infra.logger import logger
+from infra.r import r
+from models.file import get_local_path
+from models.model import Model
+
+# 推理流程或输出格式变化时递增, 让旧的缓存失效
+CACHE_VERSION = 1
+
+CACHE_SUFFIXES = {
+    "audio": ".wav",
+    "srt": ".srt",
+}
+
+
+def infer_cache_key(text: str, model: Model, mode: int, audio_profile: Optional[str] = None) -> str:
+    """
+    根据归一化后的推理输入和模型版本计算缓存 key
+    :param text: 文本, 连续空白会被合并
+    :param model: 模型, audio_model / audio_config(pitch 等) 变化后缓存自然失效
+    :param mode: AudioModeType
+    :param audio_profile: azure 音色, 不经过 azure 的模式传 None
+    """
+    inputs = {
+        "version": CACHE_VERSION,
+        "text": " ".join(text.split()),
+        "model_name": model.name,
+        "mode": int(mode),
+        "audio_model": model.audio_model,
+        "audio_config": model.audio_config,
+    }
+    if audio_profile is not None:
+        inputs["audio_profile"] = audio_profile.split(" (")[0]
+    raw = json.dumps(inputs, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def _atomic_copy(src, dest):
+    """先复制到同目录的临时文件再 os.replace, 读者不会看到只写了一半的文件"""
+    tmp = f"{dest}.{uuid.uuid4().hex}.tmp"
+    try:
+        shutil.copyfile(src, tmp)
+        os.replace(tmp, dest)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+
+class InferResultCache:
+    """
+    Content-addressed cache of inference outputs.
+
+    Files are stored under cache/infer/<key>.<suffix> in local COS storage and
+    indexed in redis; entries expire `ttl` seconds after their last use and the
+    least recently used ones are evicted beyond `max_entries`. Hits are copied to
+    the task's own output path, so evicting a cache file never breaks a File row.
+    Both directions copy through a temp file and `os.replace`, so concurrent
+    writers of the same key never expose a partially written file. The copies
+    block, call `restore` / `checkout` / `put` from a worker thread in async code.
+    """
+
+    def __init__(self, ttl: int, max_entries: int, enabled: bool = True, prefix: str = "infer_cache"):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self.prefix = prefix
+        self.lru_key = f"{prefix}:lru"
+
+    def _entry_key(self, key: str) -> str:
+        return f"{self.prefix}:{key}"
+
+    def _path(self, key: str, kind: str) -> Path:
+        return get_local_path(f"cache/infer/{key}{CACHE_SUFFIXES[kind]}")
+
+    def get(self, key: str) -> Dict[str, Path]:
+        """Returns the cached outputs of `key` (kind -> path), empty if nothing is cached."""
+        if not self.enabled:
+            return {}
+        kinds = [kind.decode() for kind in r.hkeys(self._entry_key(key))]
+        paths = {kind: self._path(key, kind) for kind in kinds if kind in CACHE_SUFFIXES}
+        paths = {kind: path for kind, path in paths.items() if path.exists()}
+        if paths:
+            pipe = r.pipeline(transaction=False)
+            pipe.expire(self._entry_key(key), self.ttl)
+            pipe.zadd(self.lru_key, {key: time.time()})
+            pipe.execute()
+        return paths
+
+    def restore(self, key: str, kind: str, dest: str) -> bool:
+        """Copies a cached output to `dest`, returns False if it is not cached."""
+        path = self.get(key).get(kind)
+        if path is None:
+            return False
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        _atomic_copy(path, dest)
+        logger.debug("infer cache hit: %s %s -> %s", kind, key, dest)
+        return True
+
+    def checkout(self, key: str, kinds: Sequence[str]) -> Optional[Dict[str, str]]:
+        """
+        Copies the cached outputs of `kinds` to temp files next to the cache files,
+        returns None (and no temp files) unless all of them are cached.
+        调用方可以在确认命中后再创建任务和文件记录, 然后用 `place` 把临时文件移到输出路径
+        """
+        paths = self.get(key)
+        if any(kind not in paths for kind in kinds):
+            return None
+        copies = {}
+        try:
+            for kind in kinds:
+                tmp = f"{paths[kind]}.{uuid.uuid4().hex}.tmp"
+                copies[kind] = tmp
+                shutil.copyfile(paths[kind], tmp)
+        except FileNotFoundError:
+            # 复制过程中被淘汰, 按未命中处理
+            self.discard(copies)
+            return None
+        return copies
+
+    @staticmethod
+    def place(copies: Dict[str, str], dests: Dict[str, str]):
+        """Moves the temp files of `checkout` to their output paths (kind -> path)."""
+        for kind, tmp in copies.items():
+            os.makedirs(os.path.dirname(dests[kind]), exist_ok=True)
+            # 输出目录可能和缓存不在同一个文件系统, shutil.move 会退化为复制
+            shutil.move(tmp, dests[kind])
+            logger.debug("infer cache hit: %s -> %s", kind, dests[kind])
+
+    @staticmethod
+    def discard(copies: Dict[str, str]):
+        for tmp in copies.values():
+            Path(tmp).unlink(missing_ok=True)
+
+    def put(self, key: str, kind: str, src: str):
+        """Stores a finished output in the cache, a new audio drops the outputs derived from the old one."""
+        if not self.enabled or not os.path.exists(src):
+            return
+        _atomic_copy(src, self._path(key, kind))
+        pipe = r.pipeline(transaction=False)
+        if kind == "audio":
+            pipe.delete(self._entry_key(key))
+        pipe.hset(self._entry_key(key), kind, 1)
+        pipe.expire(self._entry_key(key), self.ttl)
+        pipe.zadd(self.lru_key, {key: time.time()})
+        pipe.execute()
+        self._evict()
+
+    def _evict(self):
+        expired = r.zrangebyscore(self.lru_key, "-inf", time.time() - self.ttl)
+        overflow = r.zcard(self.lru_key) - len(expired) - self.max_entries
+        if overflow > 0:
+            expired += [key for key, _ in r.zpopmin(self.lru_key, overflow)]
+        for key in expired:
+            key = key.decode() if isinstance(key, bytes) else key
+            pipe = r.pipeline(transaction=False)
+            pipe.zrem(self.lru_key, key)
+            pipe.delete(self._entry_key(key))
+            pipe.execute()
+            for kind in CACHE_SUFFIXES:
+                self._path(key, kind).unlink(missing_ok=True)
+
+
+infer_cache = InferResultCache(ttl=INFER_CACHE_TTL, max_entries=INFER_CACHE_MAX_ENTRIES, enabled=INFER_CACHE_ENABLED)
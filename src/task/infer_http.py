@@ -1,22 +1,51 @@
 import asyncio
 import json
 import os
+import shutil
 import uuid
+import wave
+from contextlib import contextmanager, suppress
 from dataclasses import dataclass
 from enum import Enum
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterator, List, Optional, Tuple
 
 import azure.cognitiveservices.speech as speechsdk
-import httpx
 from dataclasses_json import DataClassJsonMixin
 from fastapi import HTTPException
 
-from common.task_queue import TaskQueue
-from infra.config import AZURE_SPEECH_KEY, AZURE_SPEECH_REGION
+from common.task_queue import DEFAULT_SERVICE_TIME, QueueFullError, TaskPriority, TaskQueue
+from infra.config import (
+    ASR_SEGMENT_PARALLELISM,
+    ASR_SEGMENT_RETRIES,
+    ASR_SEGMENT_SECONDS,
+    INFER_SCRATCH_DIR,
+    TALKING_HEAD_INFER_SLOT_TIMEOUT,
+    TTS_CHUNK_MAX_LEN,
+    TTS_CHUNK_PARALLELISM,
+    TTS_CHUNK_RETRIES,
+    TTS_STREAM_CHUNK_MAX_LEN,
+    TTS_STREAM_MAX_CONCURRENT,
+)
+from infra.downstream import audio_service, cosy_service, gpt_service, rvc_service
 from infra.file import get_file_absolute_path
 from infra.logger import logger
+from infra.metrics import timed_stage
 from models.file import query_file
 from models.model import query_model, Model
 from models.task import query_task, TaskStatus
+from task.azure_speech import azure_synthesizers, voice_name
+from task.infer_cache import infer_cache, infer_cache_key
+from task.pipeline import Stage, StagePipeline
+from task.talking_head import (
+    free_talking_head_slots,
+    submit_talking_head,
+    talking_head_infer_endpoint,
+    talking_head_slots,
+)
+from utils.audio import WavSource, concat_wavs, wav_duration, wav_stream_header
+from utils.silence import split_wav_on_silence
+from utils.srt import Cue, align_cues, parse_srt, words_to_cues, write_srt
+from utils.text import split_sentences
 
 
 class AudioModeType(int, Enum):
@@ -24,6 +53,24 @@ class AudioModeType(int, Enum):
     COSYVOICE = 2
 
 
+# 不超过该长度的文本视为交互式请求, 进入高优先级通道
+INTERACTIVE_TEXT_MAX_LEN = 100
+
+
+def text_priority(text: str) -> TaskPriority:
+    return TaskPriority.HIGH if len(text) <= INTERACTIVE_TEXT_MAX_LEN else TaskPriority.NORMAL
+
+
+def text_cache_key(text: str, model: Model, audio_profile: str, mode: AudioModeType) -> str:
+    return infer_cache_key(text, model, mode, audio_profile if mode == AudioModeType.RVC else None)
+
+
+cosy_infer_endpoint = cosy_service.endpoint("infer", "/infer", read_timeout=300, total_timeout=600)
+srt_infer_endpoint = audio_service.endpoint("srt", "/audio/gen_audio_srt", read_timeout=300, total_timeout=600)
+rvc_infer_endpoint = rvc_service.endpoint("infer", "/rvc", read_timeout=300, total_timeout=600)
+gpt_infer_endpoint = gpt_service.endpoint("infer", "/infer", read_timeout=300, total_timeout=600)
+
+
 @dataclass
 class InferText2VideoPayload(DataClassJsonMixin):
     text: str
@@ -51,76 +98,120 @@ class InferText2AudioPayload(DataClassJsonMixin):
     user_id: int
 
 
+@timed_stage("cosy_infer")
 async def cosy_infer(text: str, model_name: str, output_path: str):
-    async with httpx.AsyncClient(timeout=None) as client:
-        response = await client.post(
-            "http://127.0.0.1:3335/infer",
-            json={"text": text, "model_name": model_name, "output_path": output_path},
-        )
+    response = await cosy_infer_endpoint.request(
+        affinity=model_name,
+        json={"text": text, "model_name": model_name, "output_path": output_path},
+    )
     if response.status_code == 200:
         return output_path
     else:
         raise Exception(f"cosy_infer err, response: {response}")
 
 
+@timed_stage("srt_infer")
 async def srt_infer(audio_path: str, output_path: str, text: str = ""):
-    async with httpx.AsyncClient(timeout=None) as client:
-        response = await client.post(
-            "http://127.0.0.1:3336/audio/gen_audio_srt",
-            json={
-                "ref_text": text,
-                "audio_file": audio_path,
-                "output_path": output_path,
-            },
-        )
+    response = await srt_infer_endpoint.request(
+        json={
+            "ref_text": text,
+            "audio_file": audio_path,
+            "output_path": output_path,
+        },
+    )
     if response.status_code == 200:
         return output_path
     else:
         raise Exception(f"srt_infer err, response: {response}")
 
 
-async def azure_tts(text: str, audio_profile: str, output_dir: str):
-    # randome file name for the audio file
-    audio_file_name = "azure_" + str(uuid.uuid4()) + ".wav"
-    file_path = os.path.join(output_dir, audio_file_name)
-
-    speech_config = speechsdk.SpeechConfig(subscription=AZURE_SPEECH_KEY, region=AZURE_SPEECH_REGION)
-    audio_config = speechsdk.audio.AudioOutputConfig(use_default_speaker=True, filename=file_path)
-
-    # remove all (xxx), example: "zh-CN-XiaoxiaoNeural (Female)" to be "zh-CN-XiaoxiaoNeural"
-    audio_profile = audio_profile.split(" (")[0]
-    speech_config.speech_synthesis_voice_name = audio_profile
-
-    speech_synthesizer = speechsdk.SpeechSynthesizer(speech_config=speech_config, audio_config=audio_config)
-
-    speech_synthesis_result = speech_synthesizer.speak_text_async(text).get()
+async def segmented_srt_infer(audio_path: str, output_path: str, text: str = "") -> str:
+    """
+    长音频在静音处切成多个片段并发识别, 再按片段的开始时间合并字幕, 最后用原文 text 校正文字
+    短音频或者不是 PCM WAV 时整个交给 srt_infer
+    """
+    segment_dir = os.path.join(os.path.dirname(output_path), f"asr_{uuid.uuid4().hex}")
+    try:
+        segments = await asyncio.to_thread(split_wav_on_silence, audio_path, segment_dir, ASR_SEGMENT_SECONDS)
+        if not segments:
+            return await srt_infer(audio_path, output_path, text)
+
+        async def recognize(index: int, segment_path: str) -> List[Cue]:
+            segment_srt = await srt_infer(segment_path, os.path.join(segment_dir, f"{index}.srt"))
+            with open(segment_srt, encoding="utf-8") as f:
+                return parse_srt(f.read())
+
+        results = await _run_bounded(
+            [segment_path for _, segment_path in segments], recognize, ASR_SEGMENT_PARALLELISM, ASR_SEGMENT_RETRIES
+        )
+        cues = [
+            cue._replace(start=cue.start + offset, end=cue.end + offset)
+            for (offset, _), segment_cues in zip(segments, results)
+            for cue in segment_cues
+        ]
+        if text:
+            cues = align_cues(cues, text)
+        return write_srt(cues, output_path)
+    finally:
+        shutil.rmtree(segment_dir, ignore_errors=True)
+
+
+@timed_stage("azure_tts")
+async def azure_synthesize(text: str, audio_profile: str) -> Tuple[bytes, List[Cue]]:
+    """合成音频, 返回内存中的 WAV 数据和各个字词在音频中的时间"""
+    # 在线程池里用复用的 synthesizer 合成, 不阻塞事件循环
+    speech_synthesis_result, words = await azure_synthesizers.speak(voice_name(audio_profile), text)
 
     if speech_synthesis_result.reason == speechsdk.ResultReason.SynthesizingAudioCompleted:
-        return file_path
+        return speech_synthesis_result.audio_data, words
     elif speech_synthesis_result.reason == speechsdk.ResultReason.Canceled:
         cancellation_details = speech_synthesis_result.cancellation_details
         print("Speech synthesis canceled: {}".format(cancellation_details.reason))
-        if cancellation_details.reason == speechsdk.CancellationReason.Error:
-            if cancellation_details.error_details:
-                raise HTTPException(
-                    status_code=500,
-                    detail="Error details: {}".format(cancellation_details.error_details),
-                )
+        if cancellation_details.reason == speechsdk.CancellationReason.Error and cancellation_details.error_details:
+            raise HTTPException(
+                status_code=500,
+                detail="Error details: {}".format(cancellation_details.error_details),
+            )
+    raise HTTPException(status_code=500, detail=f"azure tts failed: {speech_synthesis_result.reason}")
+
+
+async def azure_tts(text: str, audio_profile: str, output_dir: str):
+    # randome file name for the audio file
+    audio_file_name = "azure_" + str(uuid.uuid4()) + ".wav"
+    file_path = os.path.join(output_dir, audio_file_name)
+    audio, _ = await azure_synthesize(text, audio_profile)
+    with open(file_path, "wb") as f:
+        f.write(audio)
     return file_path
 
 
+@contextmanager
+def intermediate_audio(sources: List[WavSource], output_dir: str) -> Iterator[str]:
+    """
+    把内存中的音频片段拼接后写入一个临时文件, 给只接受文件路径的下游(RVC)读取, 退出时删除
+    INFER_SCRATCH_DIR 不为空时写到该目录(如 /dev/shm), 否则写到 output_dir
+    """
+    scratch_dir = INFER_SCRATCH_DIR or output_dir
+    os.makedirs(scratch_dir, exist_ok=True)
+    path = os.path.join(scratch_dir, f"azure_{uuid.uuid4().hex}.wav")
+    try:
+        if len(sources) == 1 and isinstance(sources[0], bytes):
+            with open(path, "wb") as f:
+                f.write(sources[0])
+        else:
+            concat_wavs(sources, path)
+        yield path
+    finally:
+        with suppress(FileNotFoundError):
+            os.remove(path)
+
+
+@timed_stage("rvc_infer")
 async def rvc_infer(audio_path: str, model_name: str, output_path: str, pitch: int = 0):
-    async with httpx.AsyncClient(timeout=None) as client:
-        response = await client.post(
-            "http://127.0.0.1:3334/rvc?model_name="
-            + model_name
-            + "&output_path="
-            + output_path
-            + "&audio_path="
-            + audio_path
-            + "&pitch="
-            + str(pitch),
-        )
+    response = await rvc_infer_endpoint.request(
+        affinity=model_name,
+        params={"model_name": model_name, "output_path": output_path, "audio_path": audio_path, "pitch": pitch},
+    )
     if response.status_code == 200:
         return response.json()
     else:
@@ -128,47 +219,278 @@ async def rvc_infer(audio_path: str, model_name: str, output_path: str, pitch: i
 
 
 async def gpt_infer(text: str, model_name: str, output_path: str):
-    async with httpx.AsyncClient(timeout=None) as client:
-        response = await client.post(
-            "http://127.0.0.1:9880/infer",
-            json={"text": text, "model_name": model_name, "output_path": output_path},
-        )
+    response = await gpt_infer_endpoint.request(
+        affinity=model_name,
+        json={"text": text, "model_name": model_name, "output_path": output_path},
+    )
     if response.status_code == 200:
         return output_path
     else:
         raise Exception(f"gpt_infer err, response: {response}")
 
 
+@timed_stage("talking_head_infer")
 async def talking_head_infer(audio_path: str, model: Model, output_video_path: str, task_id: int):
     logger.debug(
         f"audio_path: {audio_path}, output_video_path: {output_video_path}, model: {model.name}, task_id: {task_id}"
     )
-    while True:
-        async with httpx.AsyncClient(timeout=None) as client:
-            response = await client.get("http://0.0.0.0:8000/talking-head/infer-ready")
-        if response.status_code != 200:
-            raise Exception(f"status_code {response.status_code}, {response.json()}")
-        if response.json().get("ready", True):
-            break
-        logger.debug("等待进行中的推理任务完成")
-        await asyncio.sleep(1)
-
-    async with httpx.AsyncClient(timeout=None) as client:
-        response = await client.post(
-            "http://0.0.0.0:8000/talking-head/inference",
-            json={
-                "input_audio_path": audio_path,
-                "output_video_path": output_video_path,
-                "speaker": model.video_model,
-                "callback_url": f"http://0.0.0.0:3333/internal/task/{task_id}",
-                "callback_method": "put",
-            },
-        )
+    # 等待空闲的 GPU 槽位, 视频推理是异步的, 结果通过回调更新
+    response = await submit_talking_head(
+        talking_head_infer_endpoint,
+        task_id,
+        TALKING_HEAD_INFER_SLOT_TIMEOUT,
+        json={
+            "input_audio_path": audio_path,
+            "output_video_path": output_video_path,
+            "speaker": model.video_model,
+        },
+        affinity=model.video_model,
+    )
     if response.status_code != 200:
         logger.debug(f"response code: {response.status_code}")
         raise Exception(f"internal_infer_video err, response code: {response.status_code}, response: {response}")
 
 
+def _start_bounded(
+    items: List[Any], run: Callable[[int, Any], Awaitable[Any]], parallelism: int, retries: int
+) -> List[asyncio.Task]:
+    """
+    按顺序启动各项的处理, 最多 parallelism 个同时进行, 失败的项单独重试 retries 次
+    """
+    semaphore = asyncio.Semaphore(parallelism)
+
+    async def run_item(index: int, item: Any) -> Any:
+        async with semaphore:
+            for attempt in range(retries + 1):
+                try:
+                    return await run(index, item)
+                except Exception as e:
+                    if attempt == retries:
+                        raise
+                    logger.warning(f"item {index} failed, attempt {attempt + 1}: {e}")
+                    await asyncio.sleep(2**attempt)
+
+    return [asyncio.create_task(run_item(index, item)) for index, item in enumerate(items)]
+
+
+async def _cancel_tasks(tasks: List[asyncio.Task]):
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def _run_bounded(
+    items: List[Any], run: Callable[[int, Any], Awaitable[Any]], parallelism: int, retries: int
+) -> List[Any]:
+    """并发处理各项(见 _start_bounded), 按原顺序返回结果, 任一项失败时取消其余的"""
+    tasks = _start_bounded(items, run, parallelism, retries)
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        await _cancel_tasks(tasks)
+        raise
+
+
+async def chunked_tts(text: str, output_path: str, synthesize: Callable[[str, str], Awaitable[str]]) -> str:
+    """
+    长文本按句切分后并发合成, 再直接拼接各片段的 WAV 到 output_path
+    :param synthesize: 合成单个片段的方法, 参数为 (片段文本, 建议的输出路径), 返回实际的音频路径
+    :return: 音频路径, 文本只有一个片段时为 synthesize 的返回值
+    """
+    chunks = split_sentences(text, TTS_CHUNK_MAX_LEN)
+    if len(chunks) <= 1:
+        return await synthesize(text, output_path)
+
+    chunk_dir = os.path.join(os.path.dirname(output_path), f"chunks_{uuid.uuid4().hex}")
+    os.makedirs(chunk_dir, exist_ok=True)
+    try:
+        paths = await _run_bounded(
+            chunks,
+            lambda index, chunk: synthesize(chunk, os.path.join(chunk_dir, f"{index}.wav")),
+            TTS_CHUNK_PARALLELISM,
+            TTS_CHUNK_RETRIES,
+        )
+        concat_wavs(paths, output_path)
+    finally:
+        shutil.rmtree(chunk_dir, ignore_errors=True)
+    return output_path
+
+
+async def azure_rvc(text: str, model: Model, audio_profile: str, output_path: str) -> List[Cue]:
+    """
+    Azure TTS 后再做 RVC, 长文本按句并发合成
+    Azure 的各个片段只保存在内存中, 拼接后写一次给 RVC, 只保留最终的输出
+    :return: 各个字词在音频中的时间, RVC 不改变时间, 可以直接用来生成字幕
+    """
+    chunks = split_sentences(text, TTS_CHUNK_MAX_LEN) or [text]
+    results = await _run_bounded(
+        chunks, lambda index, chunk: azure_synthesize(chunk, audio_profile), TTS_CHUNK_PARALLELISM, TTS_CHUNK_RETRIES
+    )
+    words = []
+    offset = 0.0
+    for audio, chunk_words in results:
+        words.extend(word._replace(start=word.start + offset, end=word.end + offset) for word in chunk_words)
+        offset += wav_duration(audio)
+    with intermediate_audio([audio for audio, _ in results], os.path.dirname(output_path)) as file_path:
+        await rvc_infer(file_path, model.audio_model, output_path, model.audio_config.get("pitch", 0))
+    return words
+
+
+async def synthesize_audio(
+    text: str,
+    model: Model,
+    audio_profile: str,
+    mode: AudioModeType,
+    output_audio_path: str,
+    output_srt_path: Optional[str] = None,
+):
+    """
+    合成音频到 output_audio_path, 相同输入的结果直接从缓存复制
+    output_srt_path: 同时生成字幕, RVC 模式根据 Azure 合成时的字词时间直接生成,
+        cosy 模式或没有字词时间(如音频来自缓存)时调用 srt_infer
+    """
+    cache_key = text_cache_key(text, model, audio_profile, mode)
+    words = None
+    if not await asyncio.to_thread(infer_cache.restore, cache_key, "audio", output_audio_path):
+        if mode == AudioModeType.COSYVOICE:
+            await chunked_tts(text, output_audio_path, lambda chunk, path: cosy_infer(chunk, model.name, path))
+        else:
+            words = await azure_rvc(text, model, audio_profile, output_audio_path)
+        await asyncio.to_thread(infer_cache.put, cache_key, "audio", output_audio_path)
+
+    if output_srt_path:
+        cues = words_to_cues(words) if words else None
+        if cues:
+            write_srt(cues, output_srt_path)
+            await asyncio.to_thread(infer_cache.put, cache_key, "srt", output_srt_path)
+        else:
+            await generate_srt(text, model, audio_profile, mode, output_audio_path, output_srt_path)
+    return output_audio_path
+
+
+async def synthesize_sentence(text: str, model: Model, audio_profile: str, mode: AudioModeType, output_path: str):
+    """
+    合成一个片段(TTS, RVC 模式再做 RVC), 不切分也不使用缓存
+    """
+    if mode == AudioModeType.COSYVOICE:
+        return await cosy_infer(text, model.name, output_path)
+    await azure_rvc(text, model, audio_profile, output_path)
+    return output_path
+
+
+class StreamLimiter:
+    """
+    Caps concurrent streaming syntheses in this process. Streams don't go
+    through a TaskQueue, so without a cap every request fans out its sentence
+    chunks to the downstream TTS/RVC services at once. Over the limit
+    `acquire` raises QueueFullError (429 with Retry-After).
+    """
+
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = limit
+        self.active = 0
+
+    def acquire(self) -> Callable[[], None]:
+        """Takes a slot, returns the function that gives it back (safe to call more than once)."""
+        if self.active >= self.limit:
+            raise QueueFullError(self.name, DEFAULT_SERVICE_TIME)
+        self.active += 1
+        released = False
+
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                self.active -= 1
+
+        return release
+
+
+stream_limiter = StreamLimiter("text2audio_stream", TTS_STREAM_MAX_CONCURRENT)
+
+
+def close_stream(work_dir: str, release: Callable[[], None]):
+    """删除流式合成的临时目录并归还 stream_limiter 的名额, 可以重复调用"""
+    shutil.rmtree(work_dir, ignore_errors=True)
+    release()
+
+
+async def stream_audio(
+    text: str, model: Model, audio_profile: str, mode: AudioModeType, work_dir: str, release: Callable[[], None]
+) -> AsyncIterator[bytes]:
+    """
+    按句合成并按原顺序输出 WAV 流: 先输出长度未知的 WAV 头, 之后每合成完一句就输出该句的采样数据
+    后面的句子在前面的句子输出时已经在并发合成, 完整的音频最后写入缓存
+    结束(包括命中缓存和客户端断开)后调用 close_stream 删除 work_dir 并归还名额
+    """
+    tasks = []
+    try:
+        cache_key = text_cache_key(text, model, audio_profile, mode)
+        cached = infer_cache.get(cache_key).get("audio")
+        if cached:
+            with wave.open(str(cached), "rb") as reader:
+                yield wav_stream_header(reader.getnchannels(), reader.getsampwidth(), reader.getframerate())
+                while True:
+                    frames = reader.readframes(reader.getframerate())
+                    if not frames:
+                        break
+                    yield frames
+            return
+
+        chunks = split_sentences(text, TTS_STREAM_CHUNK_MAX_LEN)
+        tasks = _start_bounded(
+            chunks,
+            lambda index, chunk: synthesize_sentence(
+                chunk, model, audio_profile, mode, os.path.join(work_dir, f"{index}.wav")
+            ),
+            TTS_CHUNK_PARALLELISM,
+            TTS_CHUNK_RETRIES,
+        )
+        output_path = os.path.join(work_dir, "output.wav")
+        params = None
+        with wave.open(output_path, "wb") as writer:
+            for task in tasks:
+                with wave.open(await task, "rb") as reader:
+                    current = (reader.getnchannels(), reader.getsampwidth(), reader.getframerate())
+                    frames = reader.readframes(reader.getnframes())
+                if params is None:
+                    params = current
+                    writer.setnchannels(current[0])
+                    writer.setsampwidth(current[1])
+                    writer.setframerate(current[2])
+                    yield wav_stream_header(*current)
+                elif current != params:
+                    raise ValueError(f"wav format mismatch: {current} != {params}")
+                writer.writeframes(frames)
+                yield frames
+        if params is not None:
+            await asyncio.to_thread(infer_cache.put, cache_key, "audio", output_path)
+    finally:
+        await _cancel_tasks(tasks)
+        close_stream(work_dir, release)
+
+
+async def generate_srt(
+    text: str,
+    model: Model,
+    audio_profile: str,
+    mode: AudioModeType,
+    audio_path: str,
+    output_srt_path: str,
+):
+    """
+    根据合成的音频生成字幕, 相同输入的结果直接从缓存复制
+    """
+    cache_key = text_cache_key(text, model, audio_profile, mode)
+    if await asyncio.to_thread(infer_cache.restore, cache_key, "srt", output_srt_path):
+        return output_srt_path
+
+    await srt_infer(audio_path, output_srt_path, text)
+    await asyncio.to_thread(infer_cache.put, cache_key, "srt", output_srt_path)
+    return output_srt_path
+
+
 async def infer_text2audio_task_handler(task_id: int, payload_str: str) -> None:
     # TODO getTask 从中获取fileid
     # 根据file 获取 文件路径
@@ -177,24 +499,19 @@ async def infer_text2audio_task_handler(task_id: int, payload_str: str) -> None:
 
     audiofile = await query_file(file_id=task.res["output_audio_file_id"])
     output_audio_path = audiofile.path
-    output_dir_path = os.path.dirname(output_audio_path)
 
     payload = InferText2AudioPayload(**json.loads(payload_str))
     models = await query_model(name=payload.model_name)
     model = models[0]
-    rvc_model = model.audio_model
-    rvc_pitch = model.audio_config.get("pitch", 0)
-
-    if payload.mode == AudioModeType.COSYVOICE:
-        file_path = await cosy_infer(payload.text, payload.model_name, output_audio_path)
-    else:
-        file_path = await azure_tts(payload.text, payload.audio_profile, output_dir_path)
-        file_path = await rvc_infer(file_path, rvc_model, output_audio_path, rvc_pitch)
 
+    output_srt_path = None
     if payload.gen_srt:
         srtfile = await query_file(file_id=task.res["output_srt_file_id"])
         output_srt_path = srtfile.path
-        await srt_infer(file_path, output_srt_path, payload.text)
+
+    await synthesize_audio(
+        payload.text, model, payload.audio_profile, payload.mode, output_audio_path, output_srt_path
+    )
 
 
 async def infer_audio2video_task_handler(task_id: int, payload_str: str) -> TaskStatus:
@@ -217,28 +534,51 @@ async def infer_text2video_task_handler(task_id: int, payload_str: str) -> TaskS
     task = tasks[0]
     audiofile = await query_file(file_id=task.res["output_audio_file_id"])
     output_audio_path = audiofile.path
-    output_dir_path = os.path.dirname(output_audio_path)
 
     payload = InferText2VideoPayload(**json.loads(payload_str))
     models = await query_model(name=payload.model_name)
     model = models[0]
 
-    if payload.mode == AudioModeType.COSYVOICE:
-        file_path = await cosy_infer(payload.text, model.name, output_audio_path)
-    else:
-        file_path = await azure_tts(payload.text, payload.audio_profile, output_dir_path)
-        file_path = await rvc_infer(file_path, model.audio_model, output_audio_path, model.audio_config.get("pitch", 0))
+    videofile = await query_file(file_id=task.res["output_video_file_id"])
+    output_video_path = videofile.path
 
+    output_srt_path = None
     if payload.gen_srt:
         srtfile = await query_file(file_id=task.res["output_srt_file_id"])
         output_srt_path = srtfile.path
-        await srt_infer(file_path, output_srt_path, payload.text)
-
-    # infer video asyncously
-    videofile = await query_file(file_id=task.res["output_video_file_id"])
-    output_video_path = videofile.path
+    # RVC 模式的字幕在合成音频时直接生成; cosy 模式需要 ASR, 在音频完成后和数字人视频(异步, 通过回调更新)同时进行
+    srt_with_audio = payload.mode != AudioModeType.COSYVOICE
+    stages = [
+        Stage(
+            "audio",
+            lambda results: synthesize_audio(
+                payload.text,
+                model,
+                payload.audio_profile,
+                payload.mode,
+                output_audio_path,
+                output_srt_path if srt_with_audio else None,
+            ),
+        ),
+        Stage(
+            "talking_head",
+            lambda results: talking_head_infer(results["audio"], model, output_video_path, task_id),
+            deps=["audio"],
+            callback=True,
+        ),
+    ]
+    if output_srt_path and not srt_with_audio:
+        stages.append(
+            Stage(
+                "srt",
+                lambda results: generate_srt(
+                    payload.text, model, payload.audio_profile, payload.mode, results["audio"], output_srt_path
+                ),
+                deps=["audio"],
+            )
+        )
 
-    await talking_head_infer(file_path, model, output_video_path, task_id)
+    await StagePipeline(task_id, task.res).run(stages)
     return TaskStatus.PENDING
 
 
@@ -247,9 +587,21 @@ infer_text2audio_queue = TaskQueue(
 )
 
 infer_audio2video_queue = TaskQueue(
-    "INFER_TAUDIO2VIDEO", handler=infer_audio2video_task_handler, handle_sleep=1, max_parallel_tasks=1
+    "INFER_TAUDIO2VIDEO",
+    handler=infer_audio2video_task_handler,
+    handle_sleep=1,
+    max_parallel_tasks=talking_head_slots.total_capacity,
+    free_slots=free_talking_head_slots,
 )
 
 infer_text2video_queue = TaskQueue(
-    "INFER_TEXT2VIDEO", handler=infer_text2video_task_handler, handle_sleep=1, max_parallel_tasks=1
+    "INFER_TEXT2VIDEO",
+    handler=infer_text2video_task_handler,
+    handle_sleep=1,
+    max_parallel_tasks=talking_head_slots.total_capacity,
+    free_slots=free_talking_head_slots,
 )
+
+# GPU 槽位释放时立即唤醒这两个队列
+for queue in (infer_audio2video_queue, infer_text2video_queue):
+    talking_head_slots.notify_on_release(queue.store.notify_key)
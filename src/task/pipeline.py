@@ -0,0 +1,154 @@
+import asyncio
+from enum import Enum
+from typing import Any, Awaitable, Callable, Dict, List, Sequence
+
+from infra.logger import logger
+from models.task import TaskStatus, modify_task
+
+
+class StageStatus(str, Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    # 已提交给下游服务, 结果通过 /internal/task/{task_id} 回调更新
+    SUBMITTED = "submitted"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+class Stage:
+    def __init__(
+        self,
+        name: str,
+        run: Callable[[Dict[str, Any]], Awaitable[Any]],
+        deps: Sequence[str] = (),
+        callback: bool = False,
+    ):
+        """
+        name: 阶段名, 记录在 Task.res["stages"] 中
+        run: 阶段的执行方法, 参数为已完成阶段的结果 {stage name: result}
+        deps: 依赖的阶段, 全部完成后才开始执行
+        callback: 结果由下游回调更新, 完成后状态记为 submitted
+        """
+        self.name = name
+        self.run = run
+        self.deps = list(deps)
+        self.callback = callback
+
+
+class StagePipeline:
+    """
+    Runs a small DAG of stages: every stage starts as soon as all of its
+    dependencies finished, so independent stages run concurrently. The status
+    of each stage is written to Task.res["stages"]; if a stage fails, the
+    stages that haven't finished are cancelled and the error is raised.
+
+    A `callback` stage that was already submitted can't be taken back, so once
+    one is submitted a failing stage no longer raises (the queue would fail or
+    retry the task and submit the downstream job again): the error is recorded
+    in Task.res["message"] and the callback sets the final status.
+
+    Stage statuses are merged into a freshly read row under the task lock
+    (`modify_task`), so they don't overwrite what the downstream callback
+    wrote in the meantime.
+    """
+
+    def __init__(self, task_id: int, res: dict):
+        self.task_id = task_id
+        self.res = res
+        self.results: Dict[str, Any] = {}
+
+    async def _update_stages(self, update: Callable[[Dict[str, str]], None]):
+        def modify(task):
+            res = task.res or {}
+            update(res.setdefault("stages", {}))
+            return {"res": res}
+
+        task = await modify_task(self.task_id, modify)
+        self.res = task.res
+
+    async def _set_status(self, name: str, status: StageStatus):
+        await self._update_stages(lambda stages: stages.update({name: status.value}))
+
+    async def run(self, stages: List[Stage]) -> Dict[str, Any]:
+        names = {stage.name for stage in stages}
+        for stage in stages:
+            missing = [dep for dep in stage.deps if dep not in names]
+            if missing:
+                raise ValueError(f"stage {stage.name} depends on unknown stages: {missing}")
+
+        pending = {stage.name: StageStatus.PENDING.value for stage in stages}
+        await self._update_stages(lambda stage_status: stage_status.update(pending))
+
+        running: Dict[str, asyncio.Task] = {}
+        submitted: List[str] = []
+
+        async def run_stage(stage: Stage):
+            if stage.deps:
+                await asyncio.gather(*(running[dep] for dep in stage.deps))
+            await self._set_status(stage.name, StageStatus.RUNNING)
+            try:
+                self.results[stage.name] = await stage.run(self.results)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                await self._set_status(stage.name, StageStatus.FAILED)
+                raise
+            if stage.callback:
+                submitted.append(stage.name)
+                await self._set_status(stage.name, StageStatus.SUBMITTED)
+            else:
+                await self._set_status(stage.name, StageStatus.SUCCEEDED)
+
+        for stage in stages:
+            running[stage.name] = asyncio.create_task(run_stage(stage))
+
+        try:
+            await asyncio.gather(*running.values())
+        except Exception as e:
+            message = str(e)
+            for name, task in running.items():
+                if not task.done():
+                    task.cancel()
+                    logger.debug("task %s cancel stage %s", self.task_id, name)
+            await asyncio.gather(*running.values(), return_exceptions=True)
+
+            def cancel_unfinished(stage_status: Dict[str, str]):
+                for name in running:
+                    if stage_status.get(name) in (StageStatus.PENDING.value, StageStatus.RUNNING.value):
+                        stage_status[name] = StageStatus.CANCELLED.value
+
+            if not submitted:
+                await self._update_stages(cancel_unfinished)
+                raise
+
+            def record_failure(task):
+                res = task.res or {}
+                cancel_unfinished(res.setdefault("stages", {}))
+                res["message"] = message
+                # 回调已经先把任务标记为成功时, 改为失败
+                if task.status == TaskStatus.SUCCEEDED:
+                    return {"res": res, "status": TaskStatus.FAILED}
+                return {"res": res}
+
+            task = await modify_task(self.task_id, record_failure)
+            self.res = task.res
+            logger.warning("task %s stage failed after submitting %s: %s", self.task_id, submitted, message)
+        return self.results
+
+
+def finish_submitted_stages(res: dict, succeeded: bool) -> bool:
+    """Marks stages waiting for a downstream callback as finished, returns whether res changed."""
+    stages = res.get("stages") or {}
+    status = StageStatus.SUCCEEDED if succeeded else StageStatus.FAILED
+    changed = False
+    for name, stage_status in stages.items():
+        if stage_status == StageStatus.SUBMITTED.value:
+            stages[name] = status.value
+            changed = True
+    return changed
+
+
+def stages_failed(res: dict) -> bool:
+    """Whether any stage of the task failed, e.g. the subtitles failed after the video was submitted."""
+    return any(status == StageStatus.FAILED.value for status in (res.get("stages") or {}).values())
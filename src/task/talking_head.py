@@ -0,0 +1,66 @@
+from typing import Optional
+
+import httpx
+
+from common.slots import SlotManager
+from infra.config import INTERNAL_CALLBACK_URL, TALKING_HEAD_SLOTS
+from infra.downstream import Endpoint, talking_head_service
+from infra.metrics import gauge_lines, register_collector
+
+# talking-head 的推理和训练共用 GPU, 每个副本同时只运行 TALKING_HEAD_SLOTS 个任务
+# 任务提交后立即返回, 完成后回调 /internal/task/{task_id}, 回调时释放槽位
+talking_head_slots = SlotManager(
+    "talking_head", [replica.url for replica in talking_head_service.replicas], capacity=TALKING_HEAD_SLOTS
+)
+
+talking_head_infer_endpoint = talking_head_service.endpoint(
+    "infer", "/talking-head/inference", read_timeout=30, total_timeout=60
+)
+talking_head_train_endpoint = talking_head_service.endpoint(
+    "train", "/talking-head/train", read_timeout=30, total_timeout=60
+)
+
+register_collector(
+    lambda: gauge_lines(
+        "mercury_gpu_slots_in_use",
+        "Talking-head GPU slots held by submitted tasks",
+        [({"service": talking_head_slots.name}, talking_head_slots.in_use())],
+    )
+)
+
+
+def free_talking_head_slots() -> int:
+    """健康副本上的空闲槽位数, 提交 talking-head 任务的队列只在有空闲时领取任务"""
+    return talking_head_slots.free(talking_head_service.available_urls())
+
+
+def callback_url(task_id: int) -> str:
+    return f"{INTERNAL_CALLBACK_URL}/internal/task/{task_id}"
+
+
+async def submit_talking_head(
+    endpoint: Endpoint, task_id: int, lease_timeout: float, json: dict, affinity: Optional[str] = None
+) -> httpx.Response:
+    """
+    等待空闲的 GPU 槽位后把任务提交到该副本, 提交失败(异常或非 200)时立即释放槽位
+    lease_timeout: 超过该时间没有回调时回收槽位
+    affinity: 任务使用的 speaker, 优先使用上次处理过它的副本
+    """
+    replica = await talking_head_slots.acquire(
+        task_id,
+        lease_timeout,
+        candidates=talking_head_service.available_urls,
+        preferred=talking_head_service.affinity_of(affinity),
+    )
+    try:
+        response = await endpoint.request(
+            affinity=affinity,
+            replica=replica,
+            json={**json, "callback_url": callback_url(task_id), "callback_method": "put"},
+        )
+    except BaseException:
+        talking_head_slots.release(task_id)
+        raise
+    if response.status_code != 200:
+        talking_head_slots.release(task_id)
+    return response
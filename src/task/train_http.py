@@ -2,17 +2,32 @@ import asyncio
 import json
 import os
 from dataclasses import dataclass
+from typing import List, Optional
 
-import httpx
 from dataclasses_json import DataClassJsonMixin
 
 from common.task_queue import TaskQueue
+from infra.config import AUDIO_SLICE_LOCAL, AUDIO_SLICE_WORKERS, TALKING_HEAD_TRAIN_SLOT_TIMEOUT
+from infra.downstream import audio_service, rvc_service
+from infra.logger import logger
 from models.task import TaskStatus
+from task.talking_head import (
+    free_talking_head_slots,
+    submit_talking_head,
+    talking_head_slots,
+    talking_head_train_endpoint,
+)
 from utils.file import createDir
+from utils.silence import open_pcm
+from utils.slicer import list_audio_files, slice_files
 
 TRAIN_AUDIO_KEY = "TRAIN_AUDIO"
 TRAIN_VIDEO_KEY = "TRAIN_VIDEO"
 
+# 切分和 RVC 训练是同步接口, 耗时取决于数据量, 默认不限制
+slice_audio_endpoint = audio_service.endpoint("slice", "/audio/slice_audio")
+rvc_train_endpoint = rvc_service.endpoint("train", "/train")
+
 
 @dataclass
 class TrainAudioTask(DataClassJsonMixin):
@@ -26,6 +41,14 @@ class TrainVideoTask(DataClassJsonMixin):
     speaker: str
 
 
+def slice_locally(ref_dir_name: str, output_dir_name: str) -> Optional[List[str]]:
+    """都是 PCM WAV 时在本地多进程切分, 返回片段路径; 有其它格式时返回 None, 交给 audio 服务"""
+    files = list_audio_files(ref_dir_name)
+    if not all(open_pcm(file) is not None for file in files):
+        return None
+    return slice_files(files, output_dir_name, 8, 12, 0.5, AUDIO_SLICE_WORKERS)
+
+
 async def slice_for_cosy_voice(model_name: str, task_id: int, ref_dir_name: str):
     """
     切分音频作为 cosyvoice 参考音频
@@ -35,18 +58,24 @@ async def slice_for_cosy_voice(model_name: str, task_id: int, ref_dir_name: str)
         model_name,
     )
     createDir(output_dir_name)
-    async with httpx.AsyncClient(timeout=None) as client:
-        response = await client.post(
-            "http://0.0.0.0:3336/audio/slice_audio",
-            json={
-                "audio_file": ref_dir_name,
-                "output_dir": output_dir_name,
-                "min_length": 8,
-                "max_length": 12,
-                "keep_silent": 0.5,
-                "sliding_slice": False,
-            },
-        )
+
+    # 读取文件头和切分都会阻塞, 放到线程中执行
+    if AUDIO_SLICE_LOCAL:
+        slices = await asyncio.to_thread(slice_locally, ref_dir_name, output_dir_name)
+        if slices is not None:
+            logger.info(f"sliced {ref_dir_name} into {len(slices)} slices for {model_name}")
+            return
+
+    response = await slice_audio_endpoint.request(
+        json={
+            "audio_file": ref_dir_name,
+            "output_dir": output_dir_name,
+            "min_length": 8,
+            "max_length": 12,
+            "keep_silent": 0.5,
+            "sliding_slice": False,
+        },
+    )
 
     if not response.status_code == 200:
         raise Exception(f"slice audio failed, code: {response.status_code}")
@@ -56,10 +85,9 @@ async def train_rvc(model_name: str, ref_dir_name: str, epoch: int):
     """
     训练rvc模型
     """
-    async with httpx.AsyncClient(timeout=None) as client:
-        response = await client.post(
-            "http://127.0.0.1:3334/train?name=" + model_name + "&ref_dir_name=" + ref_dir_name + "&epoch=" + str(epoch)
-        )
+    response = await rvc_train_endpoint.request(
+        params={"name": model_name, "ref_dir_name": ref_dir_name, "epoch": epoch},
+    )
 
     if not response.status_code == 200:
         raise Exception(f"response error, code: {response.status_code}")
@@ -77,26 +105,14 @@ async def train_audio_task_handler(task_id: int, task_str: str) -> None:
 
 async def train_video_task_handler(task_id: int, task_str: str) -> TaskStatus:
     task = TrainVideoTask(**json.loads(task_str))
-    # talking-head是否存在正在进行的任务
-    while True:
-        async with httpx.AsyncClient(timeout=None) as client:
-            response = await client.get("http://0.0.0.0:8000/talking-head/train-ready")
-        if response.status_code != 200:
-            raise Exception(f"status_code {response.status_code}, {response.json()}")
-        if response.json().get("ready", False):
-            break
-        await asyncio.sleep(5)
-
-    # taking-head start train
-    async with httpx.AsyncClient(timeout=None) as client:
-        response = await client.post(
-            "http://0.0.0.0:8000/talking-head/train",
-            json={
-                "speaker": task.speaker,
-                "callback_url": f"http://0.0.0.0:3333/internal/task/{task_id}",
-                "callback_method": "put",
-            },
-        )
+    # 等待 talking-head 空闲的 GPU 槽位后开始训练
+    response = await submit_talking_head(
+        talking_head_train_endpoint,
+        task_id,
+        TALKING_HEAD_TRAIN_SLOT_TIMEOUT,
+        json={"speaker": task.speaker},
+        affinity=task.speaker,
+    )
     if not response.status_code == 200:
         raise Exception(f"talking-head response error, code: {response.status_code}")
     # 视频训练的状态通过回调接口更新
@@ -111,4 +127,7 @@ train_audio_queue = TaskQueue(
 train_video_queue = TaskQueue(
     TRAIN_VIDEO_KEY,
     handler=train_video_task_handler,
+    max_parallel_tasks=talking_head_slots.total_capacity,
+    free_slots=free_talking_head_slots,
 )
+talking_head_slots.notify_on_release(train_video_queue.store.notify_key)
@@ -0,0 +1,65 @@
+import unittest
+
+from common.breaker import CircuitBreaker
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class CircuitBreakerTestCase(unittest.TestCase):
+
+    def test_open_after_consecutive_failures(self):
+        breaker = CircuitBreaker(failure_threshold=3, cooldown=10, clock=FakeClock())
+        breaker.on_failure()
+        breaker.on_failure()
+        breaker.on_success()
+        breaker.on_failure()
+        breaker.on_failure()
+        self.assertTrue(breaker.available())
+        breaker.on_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(breaker.available())
+
+    def test_single_trial_after_cooldown(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=1, cooldown=10, clock=clock)
+        breaker.on_failure()
+        clock.now = 10
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertTrue(breaker.available())
+        breaker.acquire()
+        self.assertFalse(breaker.available())
+        breaker.on_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_reopen_when_trial_fails(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=5, cooldown=10, clock=clock)
+        for _ in range(5):
+            breaker.on_failure()
+        clock.now = 10
+        breaker.acquire()
+        breaker.on_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        clock.now = 19
+        self.assertFalse(breaker.available())
+        clock.now = 20
+        self.assertTrue(breaker.available())
+
+    def test_release_trial(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=1, cooldown=10, clock=clock)
+        breaker.on_failure()
+        clock.now = 10
+        breaker.acquire()
+        breaker.release()
+        self.assertTrue(breaker.available())
+
+
+if __name__ == "__main__":
+    unittest.main()
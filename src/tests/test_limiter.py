@@ -0,0 +1,33 @@
+import unittest
+
+from common.limiter import AIMDLimiter
+
+
+class AIMDLimiterTestCase(unittest.TestCase):
+
+    def test_grow_when_saturated(self):
+        limiter = AIMDLimiter(min_limit=1, max_limit=4)
+        for _ in range(20):
+            limiter.on_success(1.0, in_flight=limiter.limit)
+        self.assertEqual(limiter.limit, 4)
+
+    def test_no_growth_when_idle(self):
+        limiter = AIMDLimiter(min_limit=1, max_limit=4, initial_limit=2)
+        for _ in range(20):
+            limiter.on_success(1.0, in_flight=1)
+        self.assertEqual(limiter.limit, 2)
+
+    def test_backoff_on_error_and_latency(self):
+        limiter = AIMDLimiter(min_limit=1, max_limit=8, initial_limit=8)
+        limiter.on_error()
+        self.assertEqual(limiter.limit, 4)
+        limiter.on_success(1.0, in_flight=4)
+        limiter.on_success(10.0, in_flight=4)
+        self.assertEqual(limiter.limit, 2)
+        for _ in range(5):
+            limiter.on_error()
+        self.assertEqual(limiter.limit, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
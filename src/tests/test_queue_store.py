@@ -0,0 +1,113 @@
+import importlib
+import sys
+import time
+import types
+import unittest
+from unittest import mock
+
+import fakeredis
+import fakeredis.aioredis
+
+
+def setUpModule():
+    # 用 fakeredis(带 lua) 代替 infra.r, 重新导入让脚本注册到 fake 的连接上
+    global queue_store
+    server = fakeredis.FakeServer()
+    fake = types.ModuleType("infra.r")
+    fake.r = fakeredis.FakeRedis(server=server)
+    fake.ar = fakeredis.aioredis.FakeRedis(server=server)
+    with mock.patch.dict(sys.modules, {"infra.r": fake}):
+        sys.modules.pop("common.queue_store", None)
+        queue_store = importlib.import_module("common.queue_store")
+    sys.modules.pop("common.queue_store", None)
+
+
+class RedisQueueStoreTestCase(unittest.TestCase):
+
+    def setUp(self):
+        queue_store.r.flushall()
+        self.store = queue_store.RedisQueueStore("test", visibility_timeout=60, lane_weights=(4, 2, 1))
+
+    def push(self, task_id, priority=1, user_id=0):
+        self.store.push(task_id, {"task_id": task_id, "priority": priority, "user_id": user_id})
+
+    def claim_ids(self, count, owner="a"):
+        return [self.store.claim(owner)["task_id"] for _ in range(count)]
+
+    def test_lane_stride(self):
+        for lane in range(3):
+            for i in range(10):
+                self.push(lane * 100 + i, priority=lane)
+        lanes = [task_id // 100 for task_id in self.claim_ids(14)]
+        self.assertEqual([lanes.count(lane) for lane in range(3)], [8, 4, 2])
+        self.assertEqual(lanes[0], 0)
+
+    def test_idle_lane_does_not_bank_credit(self):
+        for i in range(5):
+            self.push(i, priority=0)
+        self.claim_ids(5)
+        # 空闲过的低优先级通道从当前进度开始, 不会攒下份额连续抢占
+        for i in range(3):
+            self.push(200 + i, priority=2)
+            self.push(10 + i, priority=0)
+        self.assertEqual(self.claim_ids(6), [200, 10, 11, 12, 201, 202])
+
+    def test_user_interleaving(self):
+        for task_id in (1, 2, 3):
+            self.push(task_id, user_id=1)
+        self.push(4, user_id=2)
+        self.push(5, user_id=3)
+        self.assertEqual(self.claim_ids(5), [1, 4, 5, 2, 3])
+        self.assertIsNone(self.store.claim("a"))
+
+    def test_user_weight(self):
+        self.store.set_user_weight(1, 2)
+        for task_id in (1, 2, 3, 4):
+            self.push(task_id, user_id=1)
+        for task_id in (5, 6):
+            self.push(task_id, user_id=2)
+        self.assertEqual(self.claim_ids(6), [1, 5, 2, 3, 6, 4])
+
+    def test_lease_expiry(self):
+        self.push(1)
+        self.push(2)
+        self.assertEqual(self.store.claim("a")["task_id"], 1)
+        self.assertTrue(self.store.heartbeat(1, "a"))
+        self.assertEqual(self.store.requeue_expired(), [])
+
+        with mock.patch.object(queue_store.time, "time", return_value=time.time() + 61):
+            self.assertEqual(self.store.requeue_expired(), [1])
+        self.assertEqual(self.store.in_flight(), 0)
+        # 过期的任务放回通道队首, 由新的消费者领取; 原持有者不能再续约或 ack
+        self.assertEqual(self.store.claim("b")["task_id"], 1)
+        self.assertFalse(self.store.heartbeat(1, "a"))
+        self.assertFalse(self.store.ack(1, "a"))
+        self.assertTrue(self.store.ack(1, "b"))
+        self.assertEqual((self.store.size(), self.store.in_flight()), (1, 0))
+
+    def test_promote_due(self):
+        self.push(1)
+        self.push(2)
+        self.store.claim("a")
+        self.assertTrue(self.store.schedule_retry(1, "a", {"task_id": 1, "retry_count": 1}, delay=10))
+        self.assertEqual((self.store.delayed(), self.store.in_flight()), (1, 0))
+        self.assertEqual(self.store.promote_due(), 0)
+        self.assertAlmostEqual(self.store.next_due_in(), 10, delta=1)
+
+        with mock.patch.object(queue_store.time, "time", return_value=time.time() + 11):
+            self.assertEqual(self.store.promote_due(), 1)
+        self.assertIsNone(self.store.next_due_in())
+        self.assertEqual(self.store.claim("b"), {"task_id": 1, "retry_count": 1})
+
+    def test_dead_letter(self):
+        self.push(1)
+        self.store.claim("a")
+        self.assertFalse(self.store.dead_letter(1, "b", {"task_id": 1}))
+        self.assertTrue(self.store.dead_letter(1, "a", {"task_id": 1, "error": "boom"}))
+        self.assertEqual(self.store.dead_letters(), 1)
+        self.assertEqual((self.store.size(), self.store.in_flight(), self.store.delayed()), (0, 0, 0))
+        self.assertFalse(self.store.schedule_retry(1, "a", {"task_id": 1}, delay=0))
+
+
+if __name__ == "__main__":
+    unittest.main()
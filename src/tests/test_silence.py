@@ -0,0 +1,50 @@
+import os
+import tempfile
+import unittest
+import wave
+
+import numpy as np
+
+from utils.silence import silence_split_points, split_wav_on_silence
+
+
+class SilenceSplitTestCase(unittest.TestCase):
+
+    def test_split_at_quietest_frame(self):
+        energy = np.zeros(300)
+        energy[110:115] = -80
+        energy[230:235] = -80
+        points = silence_split_points(energy, segment_frames=120, smooth_frames=1)
+        self.assertEqual(len(points), 2)
+        self.assertTrue(110 <= points[0] < 115)
+        self.assertTrue(230 <= points[1] < 235)
+
+    def test_short_audio(self):
+        self.assertEqual(silence_split_points(np.zeros(100), segment_frames=100), [])
+
+    def test_split_wav(self):
+        framerate = 8000
+        loud = (np.sin(np.arange(framerate * 3) / 5) * 10000).astype("<i2")
+        quiet = np.zeros(framerate // 2, dtype="<i2")
+        samples = np.concatenate([loud, quiet, loud, quiet, loud])
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "input.wav")
+            with wave.open(path, "wb") as writer:
+                writer.setnchannels(1)
+                writer.setsampwidth(2)
+                writer.setframerate(framerate)
+                writer.writeframes(samples.tobytes())
+
+            segments = split_wav_on_silence(path, os.path.join(tmp, "segments"), segment_seconds=3.5)
+            self.assertEqual(len(segments), 3)
+            self.assertEqual(segments[0][0], 0)
+            self.assertTrue(3 <= segments[1][0] <= 3.5)
+            total = 0
+            for _, segment_path in segments:
+                with wave.open(segment_path, "rb") as reader:
+                    total += reader.getnframes()
+            self.assertEqual(total, len(samples))
+
+
+if __name__ == "__main__":
+    unittest.main()
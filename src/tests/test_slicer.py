@@ -0,0 +1,66 @@
+import os
+import tempfile
+import unittest
+import wave
+
+import numpy as np
+
+from utils.slicer import slice_files, slice_ranges
+
+
+def energy(pattern):
+    """pattern: [(秒, 是否有声音)], 每帧 0.02 秒"""
+    return np.concatenate([np.full(int(seconds / 0.02), -10.0 if loud else -80.0) for seconds, loud in pattern])
+
+
+class SliceRangesTestCase(unittest.TestCase):
+
+    def test_cut_at_pauses(self):
+        pattern = [(1, False)] + [(3, True), (0.6, False)] * 10 + [(1, False)]
+        ranges = slice_ranges(energy(pattern), min_frames=400, max_frames=600, keep_frames=25)
+        self.assertEqual(len(ranges), 3)
+        self.assertEqual(ranges[0][0], 25)
+        for start, end in ranges:
+            self.assertTrue(400 <= end - start <= 600)
+
+    def test_hard_cut_without_silence(self):
+        ranges = slice_ranges(energy([(30, True)]), min_frames=400, max_frames=600, keep_frames=25)
+        self.assertEqual(ranges, [(0, 400), (400, 800), (800, 1200)])
+
+    def test_drop_short_piece_before_long_silence(self):
+        pattern = [(3, True), (5, False), (10, True), (1, False)]
+        ranges = slice_ranges(energy(pattern), min_frames=400, max_frames=600, keep_frames=25)
+        self.assertEqual(ranges, [(375, 925)])
+
+    def test_all_silent(self):
+        self.assertEqual(slice_ranges(energy([(5, False)]), min_frames=400, max_frames=600, keep_frames=25), [])
+
+
+class SliceFilesTestCase(unittest.TestCase):
+
+    def test_slice_wav_and_skip_others(self):
+        framerate = 8000
+        loud = (np.sin(np.arange(framerate * 5) / 5) * 10000).astype("<i2")
+        quiet = np.zeros(framerate, dtype="<i2")
+        samples = np.concatenate([loud, quiet, loud, quiet, loud])
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "input.wav")
+            with wave.open(path, "wb") as writer:
+                writer.setnchannels(1)
+                writer.setsampwidth(2)
+                writer.setframerate(framerate)
+                writer.writeframes(samples.tobytes())
+            other = os.path.join(tmp, "input.mp3")
+            with open(other, "wb") as f:
+                f.write(b"ID3")
+
+            outputs = slice_files([path, other], os.path.join(tmp, "slices"), min_length=4, max_length=6)
+            self.assertEqual(
+                [os.path.basename(output) for output in outputs], ["input_0000.wav", "input_0001.wav", "input_0002.wav"]
+            )
+            with wave.open(outputs[0], "rb") as reader:
+                self.assertAlmostEqual(reader.getnframes() / framerate, 5.5, delta=0.05)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+
+from utils.srt import Cue, align_cues, format_srt, parse_srt, words_to_cues
+
+
+class WordsToCuesTestCase(unittest.TestCase):
+
+    def test_break_at_punctuation(self):
+        words = [
+            Cue(0.0, 0.4, "今天"),
+            Cue(0.4, 0.8, "天气"),
+            Cue(0.8, 1.0, "很好"),
+            Cue(1.0, 1.0, "，"),
+            Cue(1.2, 1.6, "我们"),
+            Cue(1.6, 2.0, "出去"),
+            Cue(2.0, 2.0, "。"),
+        ]
+        self.assertEqual(
+            words_to_cues(words),
+            [Cue(0.0, 1.0, "今天天气很好"), Cue(1.2, 2.0, "我们出去")],
+        )
+
+    def test_break_long_line(self):
+        words = [Cue(i, i + 1, "一二三") for i in range(5)]
+        cues = words_to_cues(words, max_len=7)
+        self.assertEqual([cue.text for cue in cues], ["一二三一二三", "一二三一二三", "一二三"])
+        self.assertEqual((cues[1].start, cues[1].end), (2, 4))
+
+    def test_english_words(self):
+        words = [Cue(0.0, 0.3, "Hello"), Cue(0.3, 0.6, "world"), Cue(0.6, 0.6, "!")]
+        self.assertEqual(words_to_cues(words), [Cue(0.0, 0.6, "Hello world!")])
+
+
+class FormatSrtTestCase(unittest.TestCase):
+
+    def test_format(self):
+        cues = [Cue(0.0, 1.5, "第一句"), Cue(61.25, 3723.004, "第二句")]
+        self.assertEqual(
+            format_srt(cues),
+            "1\n00:00:00,000 --> 00:00:01,500\n第一句\n\n2\n00:01:01,250 --> 01:02:03,004\n第二句\n",
+        )
+
+    def test_parse(self):
+        cues = [Cue(0.0, 1.5, "第一句"), Cue(61.25, 62.0, "第二句")]
+        self.assertEqual(parse_srt(format_srt(cues)), cues)
+        self.assertEqual(
+            parse_srt("1\r\n00:00:01,000 --> 00:00:02,500\r\nA\r\nB\r\n"), [Cue(1.0, 2.5, "A\nB")]
+        )
+
+
+class AlignCuesTestCase(unittest.TestCase):
+
+    def test_replace_with_ref_text(self):
+        cues = [Cue(0, 1, "今天天气很好"), Cue(1, 2, "我们去公圆吧"), Cue(2, 3, "hello word")]
+        self.assertEqual(
+            align_cues(cues, "今天天气很好，我们去公园吧！Hello, world."),
+            [Cue(0, 1, "今天天气很好"), Cue(1, 2, "我们去公园吧！"), Cue(2, 3, "Hello, world.")],
+        )
+
+    def test_unrelated_ref_text(self):
+        cues = [Cue(0, 1, "今天天气很好")]
+        self.assertEqual(align_cues(cues, "完全不相关的文字"), cues)
+
+
+if __name__ == "__main__":
+    unittest.main()
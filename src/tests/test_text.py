@@ -0,0 +1,46 @@
+import unittest
+
+from utils.text import split_sentences
+
+
+class SplitSentencesTestCase(unittest.TestCase):
+
+    def test_short_text(self):
+        self.assertEqual(split_sentences("你好。", max_len=10), ["你好。"])
+        self.assertEqual(split_sentences("  \n ", max_len=10), [])
+
+    def test_merge_short_sentences(self):
+        text = "今天天气很好。我们去公园吧！你觉得呢？"
+        self.assertEqual(split_sentences(text, max_len=14), ["今天天气很好。我们去公园吧！", "你觉得呢？"])
+
+    def test_english_sentences(self):
+        text = "Hello world. How are you? Fine."
+        self.assertEqual(split_sentences(text, max_len=20), ["Hello world.", "How are you? Fine."])
+
+    def test_split_long_sentence(self):
+        text = "第一段很长的话，第二段很长的话，第三段很长的话。"
+        chunks = split_sentences(text, max_len=10)
+        self.assertEqual(chunks, ["第一段很长的话，", "第二段很长的话，", "第三段很长的话。"])
+
+    def test_hard_split_without_punctuation(self):
+        chunks = split_sentences("一" * 25, max_len=10)
+        self.assertEqual([len(chunk) for chunk in chunks], [10, 10, 5])
+
+    def test_hard_split_english_at_spaces(self):
+        self.assertEqual(
+            split_sentences("Dr. Smith went home. He said: ok", max_len=10),
+            ["Dr.", "Smith went", "home.", "He said:", "ok"],
+        )
+        chunks = split_sentences("the quick brown fox jumps over the lazy dog", max_len=12)
+        self.assertEqual(chunks, ["the quick", "brown fox", "jumps over", "the lazy dog"])
+        self.assertEqual(split_sentences("abcdefghijklmnop", max_len=10), ["abcdefghij", "klmnop"])
+
+    def test_keep_all_text(self):
+        text = "今天天气很好。\nThis is a test. 没有句号的一长段话，中间只有逗号，还有顿号、以及冒号：结束！" * 5
+        chunks = split_sentences(text, max_len=30)
+        self.assertTrue(all(len(chunk) <= 30 for chunk in chunks))
+        self.assertEqual("".join("".join(chunks).split()), "".join(text.split()))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+import io
+import struct
+import wave
+from typing import List, Union
+
+WavSource = Union[str, bytes]
+
+# 流式输出时总长度未知, RIFF 和 data 块的长度填最大值, 播放器会一直读到连接关闭
+_UNKNOWN_SIZE = 0xFFFFFFFF
+
+
+def _open_wav(source: WavSource) -> wave.Wave_read:
+    return wave.open(io.BytesIO(source) if isinstance(source, bytes) else source, "rb")
+
+
+def concat_wavs(sources: List[WavSource], output_path: str) -> str:
+    """
+    拼接多段 PCM WAV (文件路径或 bytes), 直接拷贝采样数据, 不重新编码
+    所有片段的声道数、采样位宽和采样率必须一致
+    """
+    params = None
+    with wave.open(output_path, "wb") as writer:
+        for source in sources:
+            with _open_wav(source) as reader:
+                current = (reader.getnchannels(), reader.getsampwidth(), reader.getframerate())
+                if params is None:
+                    params = current
+                    writer.setnchannels(current[0])
+                    writer.setsampwidth(current[1])
+                    writer.setframerate(current[2])
+                elif current != params:
+                    raise ValueError(f"wav format mismatch: {current} != {params}")
+                writer.writeframes(reader.readframes(reader.getnframes()))
+    return output_path
+
+
+def wav_duration(source: WavSource) -> float:
+    """WAV 的时长, 单位为秒"""
+    with _open_wav(source) as reader:
+        return reader.getnframes() / reader.getframerate()
+
+
+def wav_stream_header(nchannels: int, sampwidth: int, framerate: int) -> bytes:
+    """长度未知的 PCM WAV 头, 后面直接跟采样数据"""
+    block_align = nchannels * sampwidth
+    return (
+        struct.pack("<4sI4s", b"RIFF", _UNKNOWN_SIZE, b"WAVE")
+        + struct.pack(
+            "<4sIHHIIHH", b"fmt ", 16, 1, nchannels, framerate, framerate * block_align, block_align, sampwidth * 8
+        )
+        + struct.pack("<4sI", b"data", _UNKNOWN_SIZE)
+    )
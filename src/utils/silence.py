@@ -0,0 +1,143 @@
+import os
+import struct
+import wave
+from typing import List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+# 支持的 PCM 采样位宽 -> 采样类型, 8 位为无符号
+_SAMPLE_TYPES = {1: np.dtype("u1"), 2: np.dtype("<i2"), 4: np.dtype("<i4")}
+_WAVE_FORMAT_PCM = 1
+_WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# 计算能量的帧长, 以及判断静音时平滑的窗口长度(秒)
+FRAME_SECONDS = 0.02
+SMOOTH_SECONDS = 0.3
+
+
+class PcmAudio(NamedTuple):
+    # (帧数, 声道数) 的采样, 通过 memmap 按需从文件读取
+    samples: np.ndarray
+    framerate: int
+    sampwidth: int
+
+    @property
+    def duration(self) -> float:
+        return len(self.samples) / self.framerate
+
+
+def open_pcm(path: str) -> Optional[PcmAudio]:
+    """
+    用 memmap 打开 PCM WAV, 长音频也不会整个读入内存
+    :return: 不是支持的 PCM WAV(8/16/32 位整数)时返回 None
+    """
+    fmt = None
+    with open(path, "rb") as f:
+        header = f.read(12)
+        if len(header) < 12 or header[:4] != b"RIFF" or header[8:12] != b"WAVE":
+            return None
+        while True:
+            chunk = f.read(8)
+            if len(chunk) < 8:
+                return None
+            chunk_id, size = struct.unpack("<4sI", chunk)
+            if chunk_id == b"fmt ":
+                body = f.read(size)
+                if len(body) < 16:
+                    return None
+                fmt = struct.unpack("<HHIIHH", body[:16])
+                if fmt[0] == _WAVE_FORMAT_EXTENSIBLE and len(body) >= 26:
+                    fmt = (struct.unpack("<H", body[24:26])[0],) + fmt[1:]
+                f.seek(size % 2, os.SEEK_CUR)
+            elif chunk_id == b"data":
+                offset = f.tell()
+                break
+            else:
+                f.seek(size + size % 2, os.SEEK_CUR)
+    if fmt is None:
+        return None
+    format_tag, nchannels, framerate, _, _, bits = fmt
+    sampwidth = bits // 8
+    if format_tag != _WAVE_FORMAT_PCM or sampwidth not in _SAMPLE_TYPES or nchannels == 0:
+        return None
+    # 流式写入的 WAV 的 data 长度可能不准确, 以文件实际长度为准
+    frames = min(size, os.path.getsize(path) - offset) // (sampwidth * nchannels)
+    if frames == 0:
+        samples = np.zeros((0, nchannels), dtype=_SAMPLE_TYPES[sampwidth])
+    else:
+        samples = np.memmap(path, dtype=_SAMPLE_TYPES[sampwidth], mode="r", offset=offset, shape=(frames, nchannels))
+    return PcmAudio(samples, framerate, sampwidth)
+
+
+def _to_mono(samples: np.ndarray, sampwidth: int) -> np.ndarray:
+    """转换为单声道, 幅度归一化到 [-1, 1]"""
+    mono = samples.astype(np.float32).mean(axis=1)
+    if sampwidth == 1:
+        return (mono - 128) / 128
+    return mono / float(2 ** (sampwidth * 8 - 1))
+
+
+def energy_db(audio: PcmAudio, frame_seconds: float = FRAME_SECONDS, block_seconds: float = 10) -> np.ndarray:
+    """按帧计算能量(dBFS), 分块计算, 不足一帧的结尾忽略"""
+    frame_len = max(1, int(audio.framerate * frame_seconds))
+    block_len = frame_len * max(1, int(block_seconds / frame_seconds))
+    usable = len(audio.samples) // frame_len * frame_len
+    energies = [np.zeros(0, dtype=np.float32)]
+    for begin in range(0, usable, block_len):
+        mono = _to_mono(audio.samples[begin : min(begin + block_len, usable)], audio.sampwidth)
+        energies.append(np.sqrt(np.mean(mono.reshape(-1, frame_len) ** 2, axis=1)))
+    return 20 * np.log10(np.concatenate(energies) + 1e-9)
+
+
+def write_pcm(audio: PcmAudio, begin: int, end: int, output_path: str) -> str:
+    """把 [begin, end) 帧写入新的 WAV"""
+    with wave.open(output_path, "wb") as writer:
+        writer.setnchannels(audio.samples.shape[1])
+        writer.setsampwidth(audio.sampwidth)
+        writer.setframerate(audio.framerate)
+        writer.writeframes(np.ascontiguousarray(audio.samples[begin:end]).tobytes())
+    return output_path
+
+
+def silence_split_points(
+    energy: np.ndarray, segment_frames: int, smooth_frames: int = int(SMOOTH_SECONDS / FRAME_SECONDS)
+) -> List[int]:
+    """
+    把音频切成约 segment_frames 帧的片段, 在每个目标切分点前后 1/4 片段的范围内选最安静的位置切分
+    :return: 切分点的帧下标, 不包括开头和结尾
+    """
+    total = len(energy)
+    if total <= segment_frames * 5 // 4:
+        return []
+    kernel = np.ones(max(1, smooth_frames)) / max(1, smooth_frames)
+    smoothed = np.convolve(energy, kernel, mode="same")
+    points = []
+    start = 0
+    while total - start > segment_frames * 5 // 4:
+        low = start + segment_frames * 3 // 4
+        high = min(start + segment_frames * 5 // 4, total)
+        start = low + int(np.argmin(smoothed[low:high]))
+        points.append(start)
+    return points
+
+
+def split_wav_on_silence(path: str, output_dir: str, segment_seconds: float) -> List[Tuple[float, str]]:
+    """
+    在静音处把长 WAV 切成约 segment_seconds 秒的片段, 写入 output_dir
+    :return: [(片段的开始时间(秒), 片段路径)], 不需要切分或者不是支持的 PCM WAV 时返回空列表
+    """
+    audio = open_pcm(path)
+    if audio is None:
+        return []
+    points = silence_split_points(energy_db(audio), int(segment_seconds / FRAME_SECONDS))
+    if not points:
+        return []
+
+    os.makedirs(output_dir, exist_ok=True)
+    frame_len = max(1, int(audio.framerate * FRAME_SECONDS))
+    bounds = [0] + [point * frame_len for point in points] + [len(audio.samples)]
+    segments = []
+    for index, (begin, end) in enumerate(zip(bounds, bounds[1:])):
+        segment_path = write_pcm(audio, begin, end, os.path.join(output_dir, f"{index}.wav"))
+        segments.append((begin / audio.framerate, segment_path))
+    return segments
@@ -0,0 +1,155 @@
+"""
+在静音处切分音频, 作为 cosyvoice 的参考音频
+
+    python -m utils.slicer <音频文件或目录> <输出目录> [--min-length 8] [--max-length 12] [--keep-silent 0.5]
+"""
+
+import argparse
+import functools
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from utils.silence import FRAME_SECONDS, energy_db, open_pcm, write_pcm
+
+# 低于该能量(dBFS)的帧视为静音, 短于 MIN_INTERVAL 秒的静音不作为切分点
+SILENCE_THRESHOLD_DB = -40
+MIN_INTERVAL = 0.3
+# 超过该长度(秒)的静音不会保留在片段中间, 之前不足最小长度的部分直接丢弃
+MAX_INNER_SILENCE = 2.0
+
+
+def slice_ranges(
+    energy: np.ndarray,
+    min_frames: int,
+    max_frames: int,
+    keep_frames: int,
+    min_interval_frames: int = int(MIN_INTERVAL / FRAME_SECONDS),
+    max_silence_frames: int = int(MAX_INNER_SILENCE / FRAME_SECONDS),
+    threshold_db: float = SILENCE_THRESHOLD_DB,
+) -> List[Tuple[int, int]]:
+    """
+    根据每帧的能量计算切分范围 [(开始帧, 结束帧)], 结束帧不包含
+    在静音处切分, 片段前后最多保留 keep_frames 帧静音, 长度在 [min_frames, max_frames] 之间;
+    到 max_frames 还没有静音时在最安静的帧切分, 不足 min_frames 的片段丢弃
+    """
+    if min_frames >= max_frames:
+        raise ValueError(f"min length must be less than max length: {min_frames} >= {max_frames}")
+    silent = energy < threshold_db
+    if silent.all():
+        return []
+    total = len(energy)
+    edges = np.diff(np.concatenate(([0], silent.astype(np.int8), [0])))
+    runs = zip(np.flatnonzero(edges == 1), np.flatnonzero(edges == -1))
+
+    # 片段中间的静音: (前一段的结束, 后一段的开始, 是否为长静音)
+    cuts = []
+    for start, end in runs:
+        start, end = int(start), int(end)
+        if start == 0 or end == total or end - start < min_interval_frames:
+            continue
+        if end - start <= keep_frames * 2:
+            middle = (start + end) // 2
+            cuts.append((middle, middle, False))
+        else:
+            cuts.append((start + keep_frames, end - keep_frames, end - start > max_silence_frames))
+    first_voiced = int(np.argmax(~silent))
+    last_voiced = total - int(np.argmax(~silent[::-1]))
+    end_limit = min(total, last_voiced + keep_frames)
+    cuts.append((end_limit, end_limit, True))
+
+    ranges = []
+    start = max(0, first_voiced - keep_frames)
+    for prev_end, next_start, long_silence in cuts:
+        if next_start <= start:
+            continue
+        while prev_end - start > max_frames:
+            low = start + min_frames
+            cut = low + int(np.argmin(energy[low : start + max_frames]))
+            ranges.append((start, cut))
+            start = cut
+        if prev_end - start >= min_frames or long_silence:
+            if prev_end - start >= min_frames:
+                ranges.append((start, prev_end))
+            start = next_start
+    return ranges
+
+
+def slice_file(
+    path: str, output_dir: str, min_length: float = 8, max_length: float = 12, keep_silent: float = 0.5
+) -> Optional[List[str]]:
+    """
+    切分一个 PCM WAV, 片段保存为 output_dir/<文件名>_<序号>.wav
+    :return: 片段路径, 不是支持的 PCM WAV 时返回 None
+    """
+    audio = open_pcm(path)
+    if audio is None:
+        return None
+    ranges = slice_ranges(
+        energy_db(audio),
+        int(min_length / FRAME_SECONDS),
+        int(max_length / FRAME_SECONDS),
+        int(keep_silent / FRAME_SECONDS),
+    )
+    frame_len = max(1, int(audio.framerate * FRAME_SECONDS))
+    stem = os.path.splitext(os.path.basename(path))[0]
+    os.makedirs(output_dir, exist_ok=True)
+    outputs = []
+    for index, (begin, end) in enumerate(ranges):
+        output_path = os.path.join(output_dir, f"{stem}_{index:04d}.wav")
+        outputs.append(write_pcm(audio, begin * frame_len, min(end * frame_len, len(audio.samples)), output_path))
+    return outputs
+
+
+def list_audio_files(path: str) -> List[str]:
+    if os.path.isdir(path):
+        return sorted(os.path.join(path, name) for name in os.listdir(path) if not name.startswith("."))
+    return [path]
+
+
+def slice_files(
+    paths: List[str],
+    output_dir: str,
+    min_length: float = 8,
+    max_length: float = 12,
+    keep_silent: float = 0.5,
+    workers: Optional[int] = None,
+) -> List[str]:
+    """
+    多进程切分多个文件, 返回所有片段的路径; 不是 PCM WAV 的文件跳过
+    子进程用 spawn 启动, 调用方可能是带事件循环和其它线程的服务进程, fork 会复制它们的锁状态
+    """
+    run = functools.partial(
+        slice_file, output_dir=output_dir, min_length=min_length, max_length=max_length, keep_silent=keep_silent
+    )
+    if len(paths) <= 1:
+        results = map(run, paths)
+    else:
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers or None, mp_context=context) as executor:
+            results = list(executor.map(run, paths))
+    return [output for outputs in results if outputs for output in outputs]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="slice audio on silence")
+    parser.add_argument("input", help="audio file or directory")
+    parser.add_argument("output_dir")
+    parser.add_argument("--min-length", type=float, default=8)
+    parser.add_argument("--max-length", type=float, default=12)
+    parser.add_argument("--keep-silent", type=float, default=0.5)
+    parser.add_argument("--workers", type=int, default=0, help="processes, default cpu count")
+    args = parser.parse_args()
+
+    paths = list_audio_files(args.input)
+    outputs = slice_files(
+        paths, args.output_dir, args.min_length, args.max_length, args.keep_silent, workers=args.workers
+    )
+    print(f"{len(paths)} files -> {len(outputs)} slices in {args.output_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+import difflib
+import re
+from typing import Iterable, List, NamedTuple
+
+# 字幕在这些标点后换行, 行尾的停顿标点不显示
+_BREAK_PUNCTUATION = "。！？!?；;…，,、：:"
+_TRAILING_PUNCTUATION = "。；;，,、：:"
+_TIMESTAMP = re.compile(r"(\d+):(\d+):(\d+)[,.](\d+)")
+# 对齐原文时只比较文字, 忽略空白和标点
+_IGNORED = re.compile(r"[\s\W_]")
+# 识别结果与原文的相似度低于该值时认为原文与音频不一致, 不做对齐
+_MIN_ALIGN_RATIO = 0.5
+
+
+class Cue(NamedTuple):
+    """一段带时间的文本, 单位为秒; 既用于 TTS 返回的单个字词, 也用于一条字幕"""
+
+    start: float
+    end: float
+    text: str
+
+
+def words_to_cues(words: Iterable[Cue], max_len: int = 20) -> List[Cue]:
+    """
+    把按时间顺序的字词合并成字幕
+    在句末和句内停顿的标点后换行, 一条字幕超过 max_len 个字符时也换行
+    """
+    cues = []
+    current: List[Cue] = []
+    length = 0
+
+    def flush():
+        nonlocal current, length
+        text = ""
+        for word in current:
+            # 英文单词之间加空格, 标点直接跟在前一个词后面
+            is_word = word.text[0].isascii() and word.text[0].isalnum()
+            separator = " " if text and is_word and text[-1].isascii() else ""
+            text = f"{text}{separator}{word.text}"
+        text = text.rstrip(_TRAILING_PUNCTUATION).strip()
+        if text:
+            cues.append(Cue(current[0].start, current[-1].end, text))
+        current, length = [], 0
+
+    for word in words:
+        if not word.text.strip():
+            continue
+        word = word._replace(text=word.text.strip())
+        is_break = word.text[-1] in _BREAK_PUNCTUATION
+        if current and not is_break and length + len(word.text) > max_len:
+            flush()
+        current.append(word)
+        length += len(word.text)
+        if is_break:
+            flush()
+    if current:
+        flush()
+    return cues
+
+
+def _timestamp(seconds: float) -> str:
+    millis = max(0, round(seconds * 1000))
+    hours, millis = divmod(millis, 3600_000)
+    minutes, millis = divmod(millis, 60_000)
+    secs, millis = divmod(millis, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d},{millis:03d}"
+
+
+def format_srt(cues: Iterable[Cue]) -> str:
+    blocks = [
+        f"{index}\n{_timestamp(cue.start)} --> {_timestamp(cue.end)}\n{cue.text}\n"
+        for index, cue in enumerate(cues, start=1)
+    ]
+    return "\n".join(blocks)
+
+
+def write_srt(cues: Iterable[Cue], output_path: str) -> str:
+    with open(output_path, "w", encoding="utf-8") as f:
+        f.write(format_srt(cues))
+    return output_path
+
+
+def _seconds(timestamp: str) -> float:
+    hours, minutes, secs, millis = _TIMESTAMP.match(timestamp.strip()).groups()
+    return int(hours) * 3600 + int(minutes) * 60 + int(secs) + int(millis) / 1000
+
+
+def parse_srt(content: str) -> List[Cue]:
+    cues = []
+    for block in re.split(r"\n\s*\n", content.replace("\r\n", "\n").strip()):
+        lines = block.strip().split("\n")
+        times = next((i for i, line in enumerate(lines) if "-->" in line), None)
+        if times is None:
+            continue
+        start, end = lines[times].split("-->")
+        cues.append(Cue(_seconds(start), _seconds(end), "\n".join(lines[times + 1 :]).strip()))
+    return cues
+
+
+def _normalize(text: str):
+    """去掉空白和标点后的小写文字, 以及每个字符在原文中的位置"""
+    chars, positions = [], []
+    for index, char in enumerate(text):
+        if not _IGNORED.match(char):
+            chars.append(char.lower())
+            positions.append(index)
+    return "".join(chars), positions
+
+
+def align_cues(cues: List[Cue], ref_text: str) -> List[Cue]:
+    """
+    用原文替换识别结果中的文字, 时间不变
+    把识别结果和原文逐字对齐(difflib), 每条字幕换成原文中对应的部分, 原文与识别结果差别过大时原样返回
+    """
+    hyp = ""
+    starts = []
+    for cue in cues:
+        starts.append(len(hyp))
+        hyp += _normalize(cue.text)[0]
+    ref, positions = _normalize(ref_text)
+    if not hyp or not ref:
+        return cues
+    matcher = difflib.SequenceMatcher(None, hyp, ref, autojunk=False)
+    if matcher.ratio() < _MIN_ALIGN_RATIO:
+        return cues
+    opcodes = matcher.get_opcodes()
+
+    def to_ref(position: int) -> int:
+        for _, i1, i2, j1, j2 in opcodes:
+            if i1 <= position < i2:
+                return j1 + (position - i1) * (j2 - j1) // (i2 - i1)
+        return len(ref)
+
+    # 每条字幕在原文中的开始位置; 两条之间的标点归前一条
+    cuts = [0] + [to_ref(start) for start in starts[1:]] + [len(ref)]
+    bounds = [0] + [positions[cut] if cut < len(ref) else len(ref_text) for cut in cuts[1:-1]] + [len(ref_text)]
+    aligned = []
+    for cue, begin, end in zip(cues, bounds, bounds[1:]):
+        text = ref_text[begin:end].strip().rstrip(_TRAILING_PUNCTUATION).strip()
+        aligned.append(cue._replace(text=text or cue.text))
+    return aligned
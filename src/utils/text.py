@@ -0,0 +1,70 @@
+import re
+from typing import List
+
+# 句末标点(中英文), 切分后标点保留在句尾
+_SENTENCE_END = re.compile(r"(?<=[。！？!?；;…\n])|(?<=\.)(?=\s)")
+# 句子过长时, 再按句内停顿切分
+_CLAUSE_END = re.compile(r"(?<=[，,、：:])")
+
+
+def _hard_split(text: str, max_len: int) -> List[str]:
+    """没有停顿的超长片段只能按长度硬切, 会切断英文单词时退到前一个空白处"""
+    pieces = []
+    text = text.strip()
+    while len(text) > max_len:
+        cut = max_len
+        if text[cut - 1].isascii() and text[cut - 1].isalnum() and text[cut].isascii() and text[cut].isalnum():
+            space = text.rfind(" ", 0, max_len)
+            if space > 0:
+                cut = space
+        pieces.append(text[:cut].strip())
+        text = text[cut:].strip()
+    if text:
+        pieces.append(text)
+    return pieces
+
+
+def _split_long(sentence: str, max_len: int) -> List[str]:
+    pieces = []
+    current = ""
+    for clause in _CLAUSE_END.split(sentence):
+        if len(current) + len(clause) <= max_len:
+            current += clause
+            continue
+        if current.strip():
+            pieces.append(current.strip())
+        *head, current = _hard_split(clause, max_len) or [""]
+        pieces.extend(head)
+    if current.strip():
+        pieces.append(current.strip())
+    return pieces
+
+
+def split_sentences(text: str, max_len: int = 120) -> List[str]:
+    """
+    把长文本切分成适合单次 TTS 的片段
+    按中英文句末标点切分, 相邻的短句合并到 max_len 以内, 超长句再按逗号等停顿切分
+    :param text: 原始文本
+    :param max_len: 单个片段的最大字符数
+    :return: 去掉首尾空白后的非空片段, 顺序与原文一致
+    """
+    chunks = []
+    current = ""
+    for sentence in _SENTENCE_END.split(text):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        if len(sentence) > max_len:
+            pieces = _split_long(sentence, max_len)
+        else:
+            pieces = [sentence]
+        for piece in pieces:
+            separator = " " if current and piece[0].isascii() and current[-1].isascii() else ""
+            if current and len(current) + len(separator) + len(piece) > max_len:
+                chunks.append(current)
+                current = piece
+            else:
+                current = f"{current}{separator}{piece}"
+    if current:
+        chunks.append(current)
+    return chunks
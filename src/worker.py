@@ -0,0 +1,50 @@
+"""
+独立的任务队列消费进程, API 进程设置 TASK_CONSUMER_QUEUES= 后只处理 HTTP 请求
+
+usage: python -m worker --queues INFER_TEXT2VIDEO,INFER_TEXT2AUDIO
+"""
+
+import argparse
+import asyncio
+import signal
+
+from common.task_queue import start_consumers
+from infra.db import database
+from infra.downstream import close_downstreams
+from infra.logger import logger
+
+# 导入即注册任务队列
+import task.infer_http  # noqa: F401
+import task.train_http  # noqa: F401
+from task.azure_speech import azure_synthesizers, warm_up_azure_voices
+
+
+async def run(queue_names: str, grace_period: float):
+    await database.connect()
+    queues = start_consumers(queue_names)
+    warm_up = asyncio.create_task(warm_up_azure_voices())
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+    await stop_event.wait()
+
+    logger.info("stopping task queues, waiting up to %ss for running tasks", grace_period)
+    await asyncio.gather(*(queue.stop(grace_period) for queue in queues))
+    await close_downstreams()
+    warm_up.cancel()
+    azure_synthesizers.shutdown()
+    await database.disconnect()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="mercury task queue worker")
+    parser.add_argument("--queues", default="*", help='逗号分隔的队列名, 默认 "*" 消费所有队列')
+    parser.add_argument("--grace-period", type=float, default=30, help="退出时等待进行中任务的秒数")
+    args = parser.parse_args()
+    asyncio.run(run(args.queues, args.grace_period))
+
+
+if __name__ == "__main__":
+    main()